@@ -1,17 +1,33 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import Integer, String, Float, Boolean, DateTime, ForeignKey
-import datetime as dt, os, secrets
-from collections import defaultdict
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, validates
+from sqlalchemy import Integer, String, Float, Boolean, Date, DateTime, ForeignKey, func, lambda_stmt, event, bindparam
+from sqlalchemy import text, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+import datetime as dt, os, secrets, sqlite3, threading, time
+from itertools import groupby
+from operator import attrgetter
 import smtplib
 from dotenv import load_dotenv
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
 from authlib.integrations.flask_client import OAuth
-from functools import wraps
-from itsdangerous import URLSafeTimedSerializer
+from functools import wraps, lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from jinja2 import FileSystemBytecodeCache
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email import policy
+from string import Template
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Load environment variables
 load_dotenv()
@@ -22,8 +38,40 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes with orjson, falling back to Flask's defaults for other types"""
+
+    def dumps(self, obj, **kwargs):
+        sort_keys = kwargs.pop('sort_keys', self.sort_keys)
+        indent = kwargs.pop('indent', None)
+        separators = kwargs.pop('separators', None)
+        # orjson covers sorted keys, compact output and two-space indents; anything else goes to json
+        if kwargs or indent not in (None, 2) or separators not in (None, (',', ':')):
+            return super().dumps(obj, sort_keys=sort_keys, indent=indent, separators=separators, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
 # Create the app
 app = Flask(__name__)
+# Trust the platform proxy's X-Forwarded-* headers for the client address and scheme. Only enabled
+# with TRUST_PROXY set, since without a proxy in front clients could spoof them
+TRUST_PROXY = os.environ.get("TRUST_PROXY", "").lower() in ("1", "true", "yes")
+if TRUST_PROXY:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1)
+# Reuse compiled templates across worker restarts instead of recompiling them
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+# Faster JSON responses when orjson is installed
+if orjson:
+    app.json = ORJSONProvider(app)
 
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY") or secrets.token_hex(32)
 
@@ -43,8 +91,48 @@ else:
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_pre_ping": True,
-    "pool_recycle": 300,
+    "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "1800")),
 }
+if DATABASE_URL:
+    # Keep warm PostgreSQL connections around instead of reconnecting under load,
+    # and fail fast rather than queueing forever when the pool is exhausted
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"].update(
+        pool_size=int(os.environ.get("DB_POOL_SIZE", "10")),
+        max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", "20")),
+        pool_timeout=int(os.environ.get("DB_POOL_TIMEOUT", "10")),
+    )
+    if DATABASE_URL.startswith("postgresql"):
+        # TCP keepalives stop idle pooled connections being silently dropped by the platform's proxy
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"]["connect_args"] = {
+            "application_name": "milk-calculator",
+            "keepalives": 1,
+            "keepalives_idle": 30,
+        }
+
+# Server-side sessions in Redis when available, signed cookies otherwise
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    import redis
+    from flask_session import Session
+    app.config["SESSION_TYPE"] = "redis"
+    app.config["SESSION_REDIS"] = redis.Redis.from_url(REDIS_URL)
+    app.config["SESSION_PERMANENT"] = False
+    app.config["PERMANENT_SESSION_LIFETIME"] = dt.timedelta(days=7)
+    Session(app)
+
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL journaling so local SQLite commits don't fsync on every write"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-64000")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
 
 # Email Configuration
 SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
@@ -52,6 +140,13 @@ SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
 EMAIL_ADDRESS = os.environ.get("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.environ.get("EMAIL_PASSWORD")
 
+# SMTP round trips run here so requests don't wait on the mail server
+email_executor = ThreadPoolExecutor(max_workers=2)
+
+# Password hashing method in Werkzeug's format, e.g. "scrypt" or "pbkdf2:sha256:600000".
+# A lower work factor makes register/login faster but hashes cheaper to brute-force.
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+
 # OAuth Configuration
 oauth = OAuth(app)
 
@@ -81,6 +176,22 @@ github = oauth.register(
 db.init_app(app)
 
 # Models
+# Currencies offered on the settings page; a user's symbol is derived from their currency code
+CURRENCIES = [
+    {'code': 'INR', 'symbol': '₹', 'name': 'Indian Rupee'},
+    {'code': 'USD', 'symbol': '$', 'name': 'US Dollar'},
+    {'code': 'EUR', 'symbol': '€', 'name': 'Euro'},
+    {'code': 'GBP', 'symbol': '£', 'name': 'British Pound'},
+    {'code': 'JPY', 'symbol': '¥', 'name': 'Japanese Yen'},
+    {'code': 'AUD', 'symbol': 'A$', 'name': 'Australian Dollar'},
+    {'code': 'CAD', 'symbol': 'C$', 'name': 'Canadian Dollar'},
+    {'code': 'CHF', 'symbol': 'Fr', 'name': 'Swiss Franc'},
+    {'code': 'CNY', 'symbol': '¥', 'name': 'Chinese Yuan'},
+    {'code': 'AED', 'symbol': 'د.إ', 'name': 'UAE Dirham'},
+]
+CURRENCY_SYMBOLS = {currency['code']: currency['symbol'] for currency in CURRENCIES}
+
+
 class User(db.Model):
     __tablename__ = 'user'
     
@@ -91,32 +202,52 @@ class User(db.Model):
     oauth_provider: Mapped[str] = mapped_column(String(20), nullable=True)
     oauth_id: Mapped[str] = mapped_column(String(200), nullable=True)
     email_verified: Mapped[bool] = mapped_column(Boolean, default=False)
-    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=dt.datetime.utcnow)
+    # Also sent with each INSERT: older SQLite tables have created_at NOT NULL with no default
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=func.now(), server_default=func.now())
     
     # User settings
     milk_price_per_litre: Mapped[float] = mapped_column(Float, default=50.0)
     currency: Mapped[str] = mapped_column(String(10), default='INR')
-    currency_symbol: Mapped[str] = mapped_column(String(5), default='₹')
     
     # Relationship to Milk records
     milk_records = relationship('Milk', back_populates='user', cascade='all, delete-orphan')
+    
+    @property
+    def currency_symbol(self):
+        return CURRENCY_SYMBOLS.get(self.currency, self.currency)
+
+
+def month_year_default(context):
+    """Derive month_year (YYYY-MM) from the date being inserted"""
+    value = context.get_current_parameters().get('date')
+    return value.strftime("%Y-%m") if value else None
 
 
 class Milk(db.Model):
     __tablename__ = 'milk'
+    __table_args__ = (
+        db.Index('uq_milk_user_date', 'user_id', 'date', unique=True),
+        db.Index('ix_milk_user_month', 'user_id', 'month_year'),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    date: Mapped[str] = mapped_column(String(250), nullable=True, index=True)
+    date: Mapped[dt.date] = mapped_column(Date, nullable=True)
     milk_qty: Mapped[float] = mapped_column(Float, nullable=True)
     cost: Mapped[float] = mapped_column(Float, nullable=True)
-    month_year: Mapped[str] = mapped_column(String(50), nullable=True, index=True)
+    month_year: Mapped[str] = mapped_column(String(7), nullable=True, default=month_year_default)
     
     # Foreign key to link to User
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('user.id'), nullable=False, index=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('user.id'), nullable=False)
     
     # Relationship back to User
     user = relationship('User', back_populates='milk_records')
 
+    @validates('date')
+    def sync_month_year(self, key, value):
+        """Keep month_year in step when date is assigned on an ORM object"""
+        self.month_year = value.strftime("%Y-%m") if value else None
+        return value
+
 
 # Create table schema in the database
 with app.app_context():
@@ -125,13 +256,13 @@ with app.app_context():
         print("✓ Database tables created/verified successfully")
         
         # Auto-migrate: Add settings columns if they don't exist
-        from sqlalchemy import text, inspect
         inspector = inspect(db.engine)
         
         # Only for PostgreSQL (check if user table exists)
         tables = inspector.get_table_names()
         if 'user' in tables:
-            columns = [col['name'] for col in inspector.get_columns('user')]
+            user_columns = inspector.get_columns('user')
+            columns = [col['name'] for col in user_columns]
             
             if 'milk_price_per_litre' not in columns:
                 db.session.execute(text('ALTER TABLE "user" ADD COLUMN milk_price_per_litre FLOAT DEFAULT 50.0'))
@@ -139,32 +270,164 @@ with app.app_context():
             if 'currency' not in columns:
                 db.session.execute(text("ALTER TABLE \"user\" ADD COLUMN currency VARCHAR(10) DEFAULT 'INR'"))
                 print("✓ Added currency column")
-            if 'currency_symbol' not in columns:
-                db.session.execute(text("ALTER TABLE \"user\" ADD COLUMN currency_symbol VARCHAR(5) DEFAULT '₹'"))
-                print("✓ Added currency_symbol column")
+            # currency_symbol is derived from currency now; DROP COLUMN needs SQLite 3.35+
+            if 'currency_symbol' in columns and (db.engine.dialect.name != 'sqlite' or sqlite3.sqlite_version_info >= (3, 35)):
+                db.session.execute(text('ALTER TABLE "user" DROP COLUMN currency_symbol'))
+                print("✓ Dropped currency_symbol column")
+            # created_at is filled in by the database now; older PostgreSQL tables need the default added
+            created_at = next((col for col in user_columns if col['name'] == 'created_at'), None)
+            if db.engine.dialect.name == 'postgresql' and created_at and created_at['default'] is None:
+                db.session.execute(text('ALTER TABLE "user" ALTER COLUMN created_at SET DEFAULT now()'))
+                print("✓ Added created_at default")
+            db.session.commit()
+        
+        # Auto-migrate: Convert legacy DD-MM-YYYY dates to ISO dates and YYYY-MM month keys
+        if 'milk' in tables:
+            date_column = next(col for col in inspector.get_columns('milk') if col['name'] == 'date')
+            if db.engine.dialect.name == 'postgresql':
+                if not isinstance(date_column['type'], Date):
+                    db.session.execute(text("ALTER TABLE milk ALTER COLUMN date TYPE DATE USING to_date(date, 'DD-MM-YYYY')"))
+                    db.session.execute(text("UPDATE milk SET month_year = to_char(date, 'YYYY-MM')"))
+                    print("✓ Converted milk dates to DATE")
+            else:
+                result = db.session.execute(text(
+                    "UPDATE milk SET date = substr(date, 7, 4) || '-' || substr(date, 4, 2) || '-' || substr(date, 1, 2), "
+                    "month_year = substr(date, 7, 4) || '-' || substr(date, 4, 2) "
+                    "WHERE date LIKE '__-__-____'"
+                ))
+                if result.rowcount:
+                    print(f"✓ Converted {result.rowcount} milk dates to YYYY-MM-DD")
+            
+            # Composite index for the per-user monthly GROUP BY; the single-column ones it replaces are dropped
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_milk_user_month ON milk (user_id, month_year)"))
+            db.session.execute(text("DROP INDEX IF EXISTS ix_milk_date"))
+            db.session.execute(text("DROP INDEX IF EXISTS ix_milk_month_year"))
+            # user_id lookups are served by the leading column of either composite index
+            db.session.execute(text("DROP INDEX IF EXISTS ix_milk_user_id"))
             db.session.commit()
         
     except Exception as e:
         print(f"✗ Database initialization error: {e}")
 
+    # One entry per user per day, enforced by the database. add() and the bulk import rely on this
+    # index for ON CONFLICT, so startup stops here if it cannot be built.
+    inspector = inspect(db.engine)
+    if 'milk' in inspector.get_table_names() and not any(
+        index['name'] == 'uq_milk_user_date' for index in inspector.get_indexes('milk')
+    ):
+        try:
+            # Older tables may hold several entries for a day. Rather than dropping any, fold each group
+            # into its earliest entry with the quantities and costs summed, so monthly totals are unchanged.
+            # Rows without a user or date never conflict on the index and are left alone.
+            duplicates = db.session.execute(text(
+                "SELECT user_id, date, COUNT(*) FROM milk WHERE user_id IS NOT NULL AND date IS NOT NULL "
+                "GROUP BY user_id, date HAVING COUNT(*) > 1"
+            )).all()
+            if duplicates:
+                db.session.execute(text(
+                    "UPDATE milk SET "
+                    "milk_qty = (SELECT SUM(dup.milk_qty) FROM milk AS dup "
+                    "WHERE dup.user_id = milk.user_id AND dup.date = milk.date), "
+                    "cost = (SELECT SUM(dup.cost) FROM milk AS dup "
+                    "WHERE dup.user_id = milk.user_id AND dup.date = milk.date) "
+                    "WHERE id IN (SELECT MIN(id) FROM milk WHERE user_id IS NOT NULL AND date IS NOT NULL "
+                    "GROUP BY user_id, date HAVING COUNT(*) > 1)"
+                ))
+                db.session.execute(text(
+                    "DELETE FROM milk WHERE EXISTS (SELECT 1 FROM milk AS kept "
+                    "WHERE kept.user_id = milk.user_id AND kept.date = milk.date AND kept.id < milk.id)"
+                ))
+                for user_id, entry_date, count in duplicates:
+                    print(f"✓ Merged {count} milk entries for user {user_id} on {entry_date}")
+            db.session.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_milk_user_date ON milk (user_id, date)"))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Could not create uq_milk_user_date: {e}")
+            raise
+
+
+# Email verification token serializer, built once since SECRET_KEY is fixed at startup
+email_serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
+
 
 # Email verification token generator
 def generate_verification_token(email):
-    serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
-    return serializer.dumps(email, salt='email-verification')
+    return email_serializer.dumps(email, salt='email-verification')
 
 
 def verify_token(token, expiration=3600):
-    serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
     try:
-        email = serializer.loads(token, salt='email-verification', max_age=expiration)
+        email = email_serializer.loads(token, salt='email-verification', max_age=expiration)
         return email
-    except:
+    except SignatureExpired:
+        # Let callers tell an expired link apart from a tampered one
+        raise
+    except BadSignature:
         return None
 
 
+# Each email worker thread keeps one logged-in SMTP session between messages. Like the executor,
+# these are per process, so every gunicorn worker (one by default) holds its own sessions.
+smtp_local = threading.local()
+
+
+def get_smtp_connection():
+    """Return this thread's SMTP session, reconnecting if the server dropped it"""
+    server = getattr(smtp_local, 'server', None)
+    if server is not None:
+        try:
+            if server.noop()[0] == 250:
+                return server
+        except (smtplib.SMTPException, OSError):
+            pass
+        close_smtp_connection()
+    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+    server.starttls()
+    server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+    smtp_local.server = server
+    return server
+
+
+def close_smtp_connection():
+    """Discard this thread's SMTP session"""
+    server = getattr(smtp_local, 'server', None)
+    smtp_local.server = None
+    if server is not None:
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+
+def deliver_email(msg):
+    """Send a prepared message over SMTP (runs on email_executor)"""
+    try:
+        get_smtp_connection().sendmail(msg['From'], [msg['To']], msg.as_bytes(policy=policy.SMTP))
+    except Exception as e:
+        close_smtp_connection()
+        print(f"Failed to send email: {e}")
+
+
+# Verification email body; only the link changes between messages
+VERIFICATION_EMAIL_TEMPLATE = Template("""
+    <html>
+      <body>
+        <h2>Welcome to Milk Calculator Dashboard!</h2>
+        <p>Please click the link below to verify your email address:</p>
+        <p><a href="$url">Verify Email</a></p>
+        <p>Or copy and paste this URL into your browser:</p>
+        <p>$url</p>
+        <p>This link will expire in 1 hour.</p>
+        <br>
+        <p>If you didn't create an account, please ignore this email.</p>
+      </body>
+    </html>
+    """)
+
+
 def send_verification_email(email, token):
-    """Send verification email to user"""
+    """Queue a verification email for the user"""
     if not EMAIL_ADDRESS or not EMAIL_PASSWORD:
         print("⚠️ Email credentials not configured. Verification email not sent.")
         return False
@@ -176,33 +439,12 @@ def send_verification_email(email, token):
     msg['From'] = EMAIL_ADDRESS
     msg['To'] = email
     
-    html = f"""
-    <html>
-      <body>
-        <h2>Welcome to Milk Calculator Dashboard!</h2>
-        <p>Please click the link below to verify your email address:</p>
-        <p><a href="{verification_url}">Verify Email</a></p>
-        <p>Or copy and paste this URL into your browser:</p>
-        <p>{verification_url}</p>
-        <p>This link will expire in 1 hour.</p>
-        <br>
-        <p>If you didn't create an account, please ignore this email.</p>
-      </body>
-    </html>
-    """
-    
-    part = MIMEText(html, 'html')
+    part = MIMEText(VERIFICATION_EMAIL_TEMPLATE.substitute(url=verification_url), 'html')
     msg.attach(part)
     
-    try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            server.send_message(msg)
-        return True
-    except Exception as e:
-        print(f"Failed to send email: {e}")
-        return False
+    # The URL is built above while the request context is still available
+    email_executor.submit(deliver_email, msg)
+    return True
 
 
 # Login required decorator
@@ -216,32 +458,121 @@ def login_required(f):
     return decorated_function
 
 
-# Helper to extract month-year from date string
-def get_month_year(date_str):
-    """Extract MM-YYYY from DD-MM-YYYY date string"""
-    if date_str:
-        parts = date_str.split('-')
-        if len(parts) == 3:
-            return f"{parts[1]}-{parts[2]}"
-    return None
+def get_current_user():
+    """Return the logged-in User; repeat calls in a request hit the session's identity map"""
+    return db.session.get(User, session.get('user_id'))
+
+
+# Template filter to show stored ISO dates as DD-MM-YYYY
+@app.template_filter('display_date')
+def display_date(value):
+    """Format a date as DD-MM-YYYY for display"""
+    return value.strftime("%d-%m-%Y") if value else ''
+
+
+@lru_cache(maxsize=None)
+def password_hash_prefix(method):
+    """Full method string Werkzeug stores for a hash method, e.g. scrypt -> scrypt:32768:8:1"""
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+def password_needs_rehash(password_hash, method=PASSWORD_HASH_METHOD):
+    """True if a stored hash was made with a different method or work factor"""
+    return password_hash.split('$', 1)[0] != password_hash_prefix(method)
+
+
+def get_user_by_email(email):
+    """Look up a user by email (unique index seek, cached statement)"""
+    return db.session.scalar(lambda_stmt(lambda: db.select(User).filter_by(email=email)))
+
+
+def dialect_insert(model):
+    """INSERT construct for the active backend, which supports ON CONFLICT"""
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def upsert_oauth_user(email, name, provider, oauth_id):
+    """Create the OAuth user if needed and return its (id, username, email) in one statement"""
+    stmt = dialect_insert(User).values(
+        email=email,
+        username=name,
+        oauth_provider=provider,
+        oauth_id=oauth_id,
+        email_verified=True
+    )
+    # No-op update on conflict so RETURNING also yields existing users unchanged
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['email'], set_={'email': stmt.excluded.email}
+    ).returning(User.id, User.username, User.email)
+    user = db.session.execute(stmt).one()
+    db.session.commit()
+    return user
+
+
+# Record lookups shared by edit and delete, built once; only the bound ids change per request
+milk_for_owner_stmt = db.select(Milk).where(Milk.id == bindparam('milk_id'), Milk.user_id == bindparam('user_id'))
+milk_with_price_stmt = (
+    db.select(Milk, User.milk_price_per_litre)
+    .join(User, Milk.user_id == User.id)
+    .where(Milk.id == bindparam('milk_id'), Milk.user_id == bindparam('user_id'))
+)
 
 
 # Helper to recalculate monthly totals (user-specific)
 def recalc_monthly_totals(user_id):
-    with app.app_context():
-        result = db.session.execute(
-            db.select(Milk)
-            .filter_by(user_id=user_id)
-            .order_by(Milk.date, Milk.id)
-        )
-        records = list(result.scalars())
-        
-        monthly_groups = defaultdict(list)
-        for r in records:
-            if r.month_year:
-                monthly_groups[r.month_year].append(r)
-        
-        db.session.commit()
+    """Return {month_year: total cost} for a user, newest month first, aggregated in SQL"""
+    result = db.session.execute(lambda_stmt(
+        lambda: db.select(Milk.month_year, db.func.sum(Milk.cost))
+        .filter_by(user_id=user_id)
+        .where(Milk.month_year.is_not(None))
+        .group_by(Milk.month_year)
+        .order_by(Milk.month_year.desc())
+    ))
+    return {month: total or 0.0 for month, total in result}
+
+
+# Page size defaults and cap for /api/milk/records
+RECORDS_PAGE_SIZE = 50
+RECORDS_PAGE_MAX = 200
+# Most entries accepted by one /api/milk/records/bulk request
+RECORDS_BULK_MAX = 1000
+
+# Months of records rendered inline on the dashboard; older months are fetched on demand
+HOME_RECENT_MONTHS = 2
+
+# Per-user dashboard data, reused until one of the user's records changes. The cache is per process:
+# the Procfile runs gunicorn with its default single worker, and if WEB_CONCURRENCY or extra replicas
+# add processes, the TTL bounds how long they serve totals whose invalidation happened elsewhere.
+HOME_CACHE_TTL = 60
+home_cache = {}
+
+
+def get_home_cache(user_id):
+    """Return cached dashboard data for a user, or None if missing or expired"""
+    entry = home_cache.get(user_id)
+    if entry is None:
+        return None
+    if entry[0] <= time.monotonic():
+        home_cache.pop(user_id, None)
+        return None
+    return entry[1]
+
+
+def set_home_cache(user_id, dashboard):
+    """Cache dashboard data for a user for HOME_CACHE_TTL seconds, evicting other expired entries"""
+    now = time.monotonic()
+    # Sweep on write so users who never come back don't keep their entry forever;
+    # the dict only ever holds users seen within the last HOME_CACHE_TTL seconds
+    for stale_id in [uid for uid, (expires, _) in home_cache.items() if expires <= now]:
+        home_cache.pop(stale_id, None)
+    home_cache[user_id] = (now + HOME_CACHE_TTL, dashboard)
+
+
+def invalidate_home_cache(user_id):
+    """Drop the cached dashboard data for a user"""
+    home_cache.pop(user_id, None)
 
 
 # Authentication Routes
@@ -254,12 +585,16 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
         
-        user = db.session.query(User).filter_by(email=email).first()
+        user = get_user_by_email(email)
         
         if user and user.password_hash and check_password_hash(user.password_hash, password):
             if not user.email_verified:
                 flash('Please verify your email before logging in', 'error')
                 return redirect(url_for('login'))
+            # Upgrade hashes made with an older method while the plaintext is at hand
+            if password_needs_rehash(user.password_hash):
+                user.password_hash = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+                db.session.commit()
             session['user_id'] = user.id
             session['username'] = user.username or user.email
             flash('Login successful!', 'success')
@@ -285,7 +620,7 @@ def register():
             flash('Passwords do not match', 'error')
             return redirect(url_for('register'))
         
-        existing_user = db.session.query(User).filter_by(email=email).first()
+        existing_user = get_user_by_email(email)
         if existing_user:
             flash('Email already registered', 'error')
             return redirect(url_for('register'))
@@ -293,7 +628,7 @@ def register():
         new_user = User(
             email=email,
             username=username,
-            password_hash=generate_password_hash(password),
+            password_hash=generate_password_hash(password, method=PASSWORD_HASH_METHOD),
             email_verified=False
         )
         db.session.add(new_user)
@@ -313,12 +648,16 @@ def register():
 
 @app.route('/verify-email/<token>')
 def verify_email(token):
-    email = verify_token(token)
+    try:
+        email = verify_token(token)
+    except SignatureExpired:
+        flash('This verification link has expired', 'error')
+        return redirect(url_for('login'))
     if not email:
-        flash('Invalid or expired verification link', 'error')
+        flash('Invalid verification link', 'error')
         return redirect(url_for('login'))
     
-    user = db.session.query(User).filter_by(email=email).first()
+    user = get_user_by_email(email)
     if user:
         user.email_verified = True
         db.session.commit()
@@ -344,17 +683,7 @@ def google_callback():
     name = user_info.get('name')
     oauth_id = user_info.get('sub')
     
-    user = db.session.query(User).filter_by(email=email).first()
-    if not user:
-        user = User(
-            email=email,
-            username=name,
-            oauth_provider='google',
-            oauth_id=oauth_id,
-            email_verified=True
-        )
-        db.session.add(user)
-        db.session.commit()
+    user = upsert_oauth_user(email, name, 'google', oauth_id)
     
     session['user_id'] = user.id
     session['username'] = user.username or user.email
@@ -386,17 +715,7 @@ def github_callback():
     name = user_info.get('name') or user_info.get('login')
     oauth_id = str(user_info.get('id'))
     
-    user = db.session.query(User).filter_by(email=email).first()
-    if not user:
-        user = User(
-            email=email,
-            username=name,
-            oauth_provider='github',
-            oauth_id=oauth_id,
-            email_verified=True
-        )
-        db.session.add(user)
-        db.session.commit()
+    user = upsert_oauth_user(email, name, 'github', oauth_id)
     
     session['user_id'] = user.id
     session['username'] = user.username or user.email
@@ -417,41 +736,154 @@ def logout():
 def home():
     user_id = session.get('user_id')
     
-    with app.app_context():
-        user = db.session.get(User, user_id)
-        if not user:
-            flash('User not found', 'error')
-            return redirect(url_for('logout'))
-        
-        result = db.session.execute(
-            db.select(Milk)
-            .filter_by(user_id=user_id)
-            .order_by(Milk.date.desc(), Milk.id.desc())
-        )
-        milk_data = list(result.scalars())
-        
-        monthly_data = defaultdict(list)
-        for record in milk_data:
-            if record.month_year:
-                monthly_data[record.month_year].append(record)
+    user = get_current_user()
+    if not user:
+        flash('User not found', 'error')
+        return redirect(url_for('logout'))
         
-        monthly_totals = {}
-        for month, records in monthly_data.items():
-            monthly_totals[month] = sum((r.cost or 0.0) for r in records)
+    dashboard = get_home_cache(user_id)
+    if dashboard is None:
+        monthly_totals = recalc_monthly_totals(user_id)
+        sorted_months = list(monthly_totals)
+        total_cost_all = sum(monthly_totals.values())
         
-        sorted_months = sorted(monthly_data.keys(), key=lambda x: dt.datetime.strptime(x, "%m-%Y"), reverse=True)
+        # Only the newest months are rendered inline; older ones load from month_records()
+        monthly_data = {}
+        if sorted_months:
+            oldest_shown = sorted_months[:HOME_RECENT_MONTHS][-1]
+            result = db.session.execute(lambda_stmt(
+                lambda: db.select(Milk.id, Milk.date, Milk.milk_qty, Milk.cost, Milk.month_year)
+                .filter_by(user_id=user_id)
+                .where(Milk.month_year >= oldest_shown)
+                .order_by(Milk.date.desc())
+            ))
+            # Rows arrive newest first, so each month's records are contiguous
+            monthly_data = {
+                month: list(records)
+                for month, records in groupby(result, key=attrgetter('month_year'))
+            }
         
-        total_cost_all = sum((m.cost or 0.0) for m in milk_data)
+        dashboard = {
+            'monthly_data': monthly_data,
+            'sorted_months': sorted_months,
+            'monthly_totals': monthly_totals,
+            'total': total_cost_all,
+        }
+        set_home_cache(user_id, dashboard)
     
     return render_template("index.html", 
-                         monthly_data=monthly_data, 
-                         sorted_months=sorted_months,
-                         monthly_totals=monthly_totals,
-                         total=total_cost_all,
+                         **dashboard,
                          username=session.get('username'),
                          currency_symbol=user.currency_symbol)
 
 
+@app.route('/api/month/<month>')
+@login_required
+def month_records(month):
+    """Return one month's records as JSON for the dashboard's collapsed months"""
+    user_id = session.get('user_id')
+    result = db.session.execute(lambda_stmt(
+        lambda: db.select(Milk.id, Milk.date, Milk.milk_qty, Milk.cost)
+        .filter_by(user_id=user_id, month_year=month)
+        .order_by(Milk.date.desc())
+    ))
+    # Values are preformatted to match what index.html renders for inline months
+    return jsonify([
+        {
+            'date': display_date(row.date),
+            'milk_qty': str(row.milk_qty),
+            'cost': str(round(row.cost or 0.0, 2)),
+            'edit_url': url_for('edit', id=row.id),
+            'delete_url': url_for('delete_data', id=row.id),
+        }
+        for row in result
+    ])
+
+
+@app.route('/api/milk/records')
+@login_required
+def milk_records_page():
+    """Return a page of the user's records, newest first, keyed by a date cursor"""
+    user_id = session.get('user_id')
+    try:
+        limit = min(max(int(request.args.get('limit', RECORDS_PAGE_SIZE)), 1), RECORDS_PAGE_MAX)
+        cursor = request.args.get('cursor')
+        before = dt.date.fromisoformat(cursor) if cursor else dt.date.max
+    except ValueError:
+        return jsonify(error='Invalid cursor or limit'), 400
+    
+    # Seeks the (user_id, date) index; the extra row only signals another page
+    rows = db.session.execute(
+        db.select(Milk.id, Milk.date, Milk.milk_qty, Milk.cost, Milk.month_year)
+        .filter_by(user_id=user_id)
+        .where(Milk.date < before)
+        .order_by(Milk.date.desc())
+        .limit(limit + 1)
+    ).all()
+    page = rows[:limit]
+    response = {
+        'records': [
+            {
+                'id': row.id,
+                'date': row.date.isoformat(),
+                'milk_qty': row.milk_qty,
+                'cost': row.cost,
+                'month_year': row.month_year,
+            }
+            for row in page
+        ],
+        'next_cursor': page[-1].date.isoformat() if len(rows) > limit else None,
+    }
+    if not cursor:
+        # Counted in SQL once, on the first page, rather than on every page
+        response['total_records'] = db.session.scalar(
+            db.select(db.func.count()).select_from(Milk).filter_by(user_id=user_id)
+        )
+    return jsonify(response)
+
+
+@app.route('/api/milk/records/bulk', methods=['POST'])
+@login_required
+def bulk_add_records():
+    """Insert a JSON list of {date, milk_qty} entries at once, skipping dates that already exist"""
+    user_id = session.get('user_id')
+    entries = request.get_json(silent=True)
+    if not isinstance(entries, list) or len(entries) > RECORDS_BULK_MAX:
+        return jsonify(error=f'Expected a JSON list of at most {RECORDS_BULK_MAX} records'), 400
+    
+    milk_price = db.session.scalar(lambda_stmt(
+        lambda: db.select(User.milk_price_per_litre).filter_by(id=user_id)
+    ))
+    if milk_price is None:
+        milk_price = 50.0
+    
+    rows = []
+    try:
+        for entry in entries:
+            milk_qty = float(entry['milk_qty'])
+            rows.append({
+                'user_id': user_id,
+                'date': dt.date.fromisoformat(entry['date']),
+                'milk_qty': milk_qty,
+                'cost': milk_qty * milk_price,
+            })
+    except (KeyError, TypeError, ValueError):
+        return jsonify(error='Each record needs an ISO date and a numeric milk_qty'), 400
+    
+    inserted = []
+    if rows:
+        # One executemany, which SQLAlchemy batches into multi-row INSERT ... VALUES statements
+        inserted = db.session.execute(
+            dialect_insert(Milk)
+            .on_conflict_do_nothing(index_elements=['user_id', 'date'])
+            .returning(Milk.id),
+            rows
+        ).all()
+        db.session.commit()
+        invalidate_home_cache(user_id)
+    return jsonify(inserted=len(inserted), skipped=len(rows) - len(inserted))
+
+
 @app.route("/edit", methods=["GET", "POST"])
 @login_required
 def edit():
@@ -459,20 +891,21 @@ def edit():
     
     if request.method == "POST":
         milk_id = int(request.form.get("id"))
-        milk_record = db.session.execute(
-            db.select(Milk).filter_by(id=milk_id, user_id=user_id)
-        ).scalar_one_or_none()
+        # Fetch the record and the owner's price together in one round trip
+        row = db.session.execute(
+            milk_with_price_stmt, {'milk_id': milk_id, 'user_id': user_id}
+        ).one_or_none()
         
-        if not milk_record:
+        if not row:
             flash('Record not found or access denied', 'error')
             return redirect(url_for("home"))
+        milk_record, milk_price = row
         
         new_date_raw = request.form.get("date")
         if new_date_raw:
             try:
-                parsed = dt.datetime.strptime(new_date_raw, "%Y-%m-%d")
-                milk_record.date = parsed.strftime("%d-%m-%Y")
-                milk_record.month_year = parsed.strftime("%m-%Y")
+                parsed = dt.date.fromisoformat(new_date_raw)
+                milk_record.date = parsed
             except (ValueError, TypeError):
                 pass
 
@@ -481,23 +914,29 @@ def edit():
         except (ValueError, TypeError):
             return redirect(url_for("home"))
 
-        user = db.session.get(User, user_id)
-        milk_price = user.milk_price_per_litre if user else 50.0
+        if milk_price is None:
+            milk_price = 50.0
         new_cost = new_qty * milk_price
 
         milk_record.milk_qty = new_qty
         milk_record.cost = new_cost
-        db.session.commit()
-
-        recalc_monthly_totals(user_id)
+        entry_date = milk_record.date
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Moving the record onto a day that already has an entry trips uq_milk_user_date
+            db.session.rollback()
+            flash(f'An entry for {display_date(entry_date)} already exists!', 'error')
+            return redirect(url_for("home"))
+        invalidate_home_cache(user_id)
 
         flash('Record updated successfully!', 'success')
         return redirect(url_for("home"))
     else:
         milk_id = request.args.get("id")
-        milk_record = db.session.execute(
-            db.select(Milk).filter_by(id=int(milk_id), user_id=user_id)
-        ).scalar_one_or_none()
+        milk_record = db.session.scalar(
+            milk_for_owner_stmt, {'milk_id': int(milk_id), 'user_id': user_id}
+        )
         
         if not milk_record:
             flash('Record not found or access denied', 'error')
@@ -512,9 +951,9 @@ def delete_data():
     user_id = session.get('user_id')
     
     milk_id = request.args.get('id')
-    milk_to_delete = db.session.execute(
-        db.select(Milk).filter_by(id=int(milk_id), user_id=user_id)
-    ).scalar_one_or_none()
+    milk_to_delete = db.session.scalar(
+        milk_for_owner_stmt, {'milk_id': int(milk_id), 'user_id': user_id}
+    )
     
     if not milk_to_delete:
         flash('Record not found or access denied', 'error')
@@ -522,8 +961,7 @@ def delete_data():
     
     db.session.delete(milk_to_delete)
     db.session.commit()
-
-    recalc_monthly_totals(user_id)
+    invalidate_home_cache(user_id)
     
     flash('Record deleted successfully!', 'success')
     return redirect(url_for('home'))
@@ -535,8 +973,12 @@ def add():
     user_id = session.get('user_id')
     
     if request.method == "POST":
-        user = db.session.get(User, user_id)
-        milk_price = user.milk_price_per_litre if user else 50.0
+        # Only the price is needed, so skip loading the whole User row
+        milk_price = db.session.scalar(lambda_stmt(
+            lambda: db.select(User.milk_price_per_litre).filter_by(id=user_id)
+        ))
+        if milk_price is None:
+            milk_price = 50.0
         
         milk_qty_raw = request.form.get("number", "0")
         try:
@@ -547,41 +989,27 @@ def add():
 
         cost = milk_qty * milk_price
         
-        date_raw = request.form.get("date")
-        if date_raw:
-            try:
-                parsed = dt.datetime.strptime(date_raw, "%Y-%m-%d")
-                date_str = parsed.strftime("%d-%m-%Y")
-                month_year_str = parsed.strftime("%m-%Y")
-            except (ValueError, TypeError):
-                now = dt.datetime.now()
-                date_str = now.strftime("%d-%m-%Y")
-                month_year_str = now.strftime("%m-%Y")
-        else:
-            now = dt.datetime.now()
-            date_str = now.strftime("%d-%m-%Y")
-            month_year_str = now.strftime("%m-%Y")
-
-        with app.app_context():
-            existing_entry = db.session.execute(
-                db.select(Milk).filter_by(date=date_str, user_id=user_id)
-            ).scalar_one_or_none()
-            
-            if existing_entry:
-                flash(f'An entry for {date_str} already exists!', 'error')
-                return redirect(url_for('add'))
+        try:
+            entry_date = dt.date.fromisoformat(request.form.get("date"))
+        except (ValueError, TypeError):
+            entry_date = dt.date.today()
 
-            new_record = Milk(
+        # One round trip; the (user_id, date) unique index rejects duplicates
+        result = db.session.execute(
+            dialect_insert(Milk)
+            .values(
                 milk_qty=milk_qty,
-                date=date_str,
+                date=entry_date,
                 cost=cost,
-                month_year=month_year_str,
                 user_id=user_id
             )
-            db.session.add(new_record)
-            db.session.commit()
-
-            recalc_monthly_totals(user_id)
+            .on_conflict_do_nothing(index_elements=['user_id', 'date'])
+        )
+        db.session.commit()
+        if result.rowcount == 0:
+            flash(f'An entry for {display_date(entry_date)} already exists!', 'error')
+            return redirect(url_for('add'))
+        invalidate_home_cache(user_id)
         
         flash('Record added successfully!', 'success')
         return redirect(url_for('home'))
@@ -593,7 +1021,7 @@ def add():
 @login_required
 def settings():
     user_id = session.get('user_id')
-    user = db.session.get(User, user_id)
+    user = get_current_user()
     
     if not user:
         flash('User not found', 'error')
@@ -602,7 +1030,8 @@ def settings():
     if request.method == 'POST':
         milk_price = request.form.get('milk_price')
         currency = request.form.get('currency', 'INR')
-        currency_symbol = request.form.get('currency_symbol', '₹')
+        if currency not in CURRENCY_SYMBOLS:
+            currency = 'INR'
         recalculate = request.form.get('recalculate') == 'yes'
         
         try:
@@ -615,19 +1044,16 @@ def settings():
             
             user.milk_price_per_litre = new_price
             user.currency = currency
-            user.currency_symbol = currency_symbol
             db.session.commit()
             
             if recalculate and old_price != new_price:
-                milk_records = db.session.execute(
-                    db.select(Milk).filter_by(user_id=user_id)
-                ).scalars().all()
-                
-                for record in milk_records:
-                    record.cost = record.milk_qty * new_price
-                
+                result = db.session.execute(
+                    db.update(Milk).filter_by(user_id=user_id).values(cost=Milk.milk_qty * new_price),
+                    execution_options={'synchronize_session': False}
+                )
                 db.session.commit()
-                flash(f'Settings updated! Recalculated {len(milk_records)} records with new price.', 'success')
+                invalidate_home_cache(user_id)
+                flash(f'Settings updated! Recalculated {result.rowcount} records with new price.', 'success')
             else:
                 flash('Settings updated successfully!', 'success')
             
@@ -637,20 +1063,7 @@ def settings():
             flash('Invalid milk price', 'error')
             return redirect(url_for('settings'))
     
-    currencies = [
-        {'code': 'INR', 'symbol': '₹', 'name': 'Indian Rupee'},
-        {'code': 'USD', 'symbol': '$', 'name': 'US Dollar'},
-        {'code': 'EUR', 'symbol': '€', 'name': 'Euro'},
-        {'code': 'GBP', 'symbol': '£', 'name': 'British Pound'},
-        {'code': 'JPY', 'symbol': '¥', 'name': 'Japanese Yen'},
-        {'code': 'AUD', 'symbol': 'A$', 'name': 'Australian Dollar'},
-        {'code': 'CAD', 'symbol': 'C$', 'name': 'Canadian Dollar'},
-        {'code': 'CHF', 'symbol': 'Fr', 'name': 'Swiss Franc'},
-        {'code': 'CNY', 'symbol': '¥', 'name': 'Chinese Yuan'},
-        {'code': 'AED', 'symbol': 'د.إ', 'name': 'UAE Dirham'},
-    ]
-    
-    return render_template('settings.html', user=user, currencies=currencies)
+    return render_template('settings.html', user=user, currencies=CURRENCIES)
 
 
 if __name__ == "__main__":
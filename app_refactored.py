@@ -1,22 +1,46 @@
 # File: app_refactored.py
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
 from authlib.integrations.flask_client import OAuth
-from sqlalchemy import text, inspect
+from itsdangerous import SignatureExpired
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import Date, text, inspect, lambda_stmt
+from sqlalchemy.exc import IntegrityError
 import datetime as dt
-from collections import defaultdict
+import sqlite3
+from itertools import groupby
+from operator import attrgetter
 
 # Import from our new modules
 from utils.config import Config
-from models.models import db, User, Milk
+from models.models import db, User, Milk, CURRENCIES, CURRENCY_SYMBOLS
 from views.helpers import (
-    login_required, get_month_year, recalc_monthly_totals,
-    generate_verification_token, verify_token, send_verification_email
+    ORJSONProvider, orjson, login_required, get_current_user, display_date, get_user_by_email, dialect_insert,
+    upsert_oauth_user, password_needs_rehash, recalc_monthly_totals, milk_for_owner_stmt, milk_with_price_stmt,
+    generate_verification_token, verify_token, send_verification_email,
+    HOME_RECENT_MONTHS, RECORDS_PAGE_SIZE, RECORDS_PAGE_MAX, RECORDS_BULK_MAX,
+    get_home_cache, set_home_cache, invalidate_home_cache
 )
 
 # Create app
 app = Flask(__name__)
 app.config.from_object(Config)
+# Trust the platform proxy's X-Forwarded-* headers for the client address and scheme
+if app.config["TRUST_PROXY"]:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1)
+app.add_template_filter(display_date)
+# Reuse compiled templates across worker restarts instead of recompiling them
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+# Faster JSON responses when orjson is installed
+if orjson:
+    app.json = ORJSONProvider(app)
+
+if app.config['REDIS_URL']:
+    import redis
+    from flask_session import Session
+    app.config['SESSION_REDIS'] = redis.Redis.from_url(app.config['REDIS_URL'])
+    Session(app)
 
 # Initialize extensions
 db.init_app(app)
@@ -54,7 +78,8 @@ with app.app_context():
         tables = inspector.get_table_names()
         
         if 'user' in tables:
-            columns = [col['name'] for col in inspector.get_columns('user')]
+            user_columns = inspector.get_columns('user')
+            columns = [col['name'] for col in user_columns]
             
             if 'milk_price_per_litre' not in columns:
                 db.session.execute(text('ALTER TABLE "user" ADD COLUMN milk_price_per_litre FLOAT DEFAULT 50.0'))
@@ -62,14 +87,82 @@ with app.app_context():
             if 'currency' not in columns:
                 db.session.execute(text("ALTER TABLE \"user\" ADD COLUMN currency VARCHAR(10) DEFAULT 'INR'"))
                 print("✓ Added currency column")
-            if 'currency_symbol' not in columns:
-                db.session.execute(text("ALTER TABLE \"user\" ADD COLUMN currency_symbol VARCHAR(5) DEFAULT '₹'"))
-                print("✓ Added currency_symbol column")
+            # currency_symbol is derived from currency now; DROP COLUMN needs SQLite 3.35+
+            if 'currency_symbol' in columns and (db.engine.dialect.name != 'sqlite' or sqlite3.sqlite_version_info >= (3, 35)):
+                db.session.execute(text('ALTER TABLE "user" DROP COLUMN currency_symbol'))
+                print("✓ Dropped currency_symbol column")
+            # created_at is filled in by the database now; older PostgreSQL tables need the default added
+            created_at = next((col for col in user_columns if col['name'] == 'created_at'), None)
+            if db.engine.dialect.name == 'postgresql' and created_at and created_at['default'] is None:
+                db.session.execute(text('ALTER TABLE "user" ALTER COLUMN created_at SET DEFAULT now()'))
+                print("✓ Added created_at default")
+            db.session.commit()
+        
+        # Auto-migrate: Convert legacy DD-MM-YYYY dates to ISO dates and YYYY-MM month keys
+        if 'milk' in tables:
+            date_column = next(col for col in inspector.get_columns('milk') if col['name'] == 'date')
+            if db.engine.dialect.name == 'postgresql':
+                if not isinstance(date_column['type'], Date):
+                    db.session.execute(text("ALTER TABLE milk ALTER COLUMN date TYPE DATE USING to_date(date, 'DD-MM-YYYY')"))
+                    db.session.execute(text("UPDATE milk SET month_year = to_char(date, 'YYYY-MM')"))
+                    print("✓ Converted milk dates to DATE")
+            else:
+                result = db.session.execute(text(
+                    "UPDATE milk SET date = substr(date, 7, 4) || '-' || substr(date, 4, 2) || '-' || substr(date, 1, 2), "
+                    "month_year = substr(date, 7, 4) || '-' || substr(date, 4, 2) "
+                    "WHERE date LIKE '__-__-____'"
+                ))
+                if result.rowcount:
+                    print(f"✓ Converted {result.rowcount} milk dates to YYYY-MM-DD")
+            
+            # Composite index for the per-user monthly GROUP BY; the single-column ones it replaces are dropped
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_milk_user_month ON milk (user_id, month_year)"))
+            db.session.execute(text("DROP INDEX IF EXISTS ix_milk_date"))
+            db.session.execute(text("DROP INDEX IF EXISTS ix_milk_month_year"))
+            # user_id lookups are served by the leading column of either composite index
+            db.session.execute(text("DROP INDEX IF EXISTS ix_milk_user_id"))
             db.session.commit()
         
     except Exception as e:
         print(f"✗ Database initialization error: {e}")
 
+    # One entry per user per day, enforced by the database. add() and the bulk import rely on this
+    # index for ON CONFLICT, so startup stops here if it cannot be built.
+    inspector = inspect(db.engine)
+    if 'milk' in inspector.get_table_names() and not any(
+        index['name'] == 'uq_milk_user_date' for index in inspector.get_indexes('milk')
+    ):
+        try:
+            # Older tables may hold several entries for a day. Rather than dropping any, fold each group
+            # into its earliest entry with the quantities and costs summed, so monthly totals are unchanged.
+            # Rows without a user or date never conflict on the index and are left alone.
+            duplicates = db.session.execute(text(
+                "SELECT user_id, date, COUNT(*) FROM milk WHERE user_id IS NOT NULL AND date IS NOT NULL "
+                "GROUP BY user_id, date HAVING COUNT(*) > 1"
+            )).all()
+            if duplicates:
+                db.session.execute(text(
+                    "UPDATE milk SET "
+                    "milk_qty = (SELECT SUM(dup.milk_qty) FROM milk AS dup "
+                    "WHERE dup.user_id = milk.user_id AND dup.date = milk.date), "
+                    "cost = (SELECT SUM(dup.cost) FROM milk AS dup "
+                    "WHERE dup.user_id = milk.user_id AND dup.date = milk.date) "
+                    "WHERE id IN (SELECT MIN(id) FROM milk WHERE user_id IS NOT NULL AND date IS NOT NULL "
+                    "GROUP BY user_id, date HAVING COUNT(*) > 1)"
+                ))
+                db.session.execute(text(
+                    "DELETE FROM milk WHERE EXISTS (SELECT 1 FROM milk AS kept "
+                    "WHERE kept.user_id = milk.user_id AND kept.date = milk.date AND kept.id < milk.id)"
+                ))
+                for user_id, entry_date, count in duplicates:
+                    print(f"✓ Merged {count} milk entries for user {user_id} on {entry_date}")
+            db.session.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_milk_user_date ON milk (user_id, date)"))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Could not create uq_milk_user_date: {e}")
+            raise
+
 
 # ============================================================================
 # AUTHENTICATION ROUTES
@@ -84,12 +177,17 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
         
-        user = db.session.query(User).filter_by(email=email).first()
+        user = get_user_by_email(email)
         
         if user and user.password_hash and check_password_hash(user.password_hash, password):
             if not user.email_verified:
                 flash('Please verify your email before logging in', 'error')
                 return redirect(url_for('login'))
+            # Upgrade hashes made with an older method while the plaintext is at hand
+            hash_method = app.config['PASSWORD_HASH_METHOD']
+            if password_needs_rehash(user.password_hash, hash_method):
+                user.password_hash = generate_password_hash(password, method=hash_method)
+                db.session.commit()
             session['user_id'] = user.id
             session['username'] = user.username or user.email
             flash('Login successful!', 'success')
@@ -115,7 +213,7 @@ def register():
             flash('Passwords do not match', 'error')
             return redirect(url_for('register'))
         
-        existing_user = db.session.query(User).filter_by(email=email).first()
+        existing_user = get_user_by_email(email)
         if existing_user:
             flash('Email already registered', 'error')
             return redirect(url_for('register'))
@@ -123,7 +221,7 @@ def register():
         new_user = User(
             email=email,
             username=username,
-            password_hash=generate_password_hash(password),
+            password_hash=generate_password_hash(password, method=app.config['PASSWORD_HASH_METHOD']),
             email_verified=True  # Set to True for easy testing
         )
         db.session.add(new_user)
@@ -150,12 +248,16 @@ def register():
 
 @app.route('/verify-email/<token>')
 def verify_email(token):
-    email = verify_token(token, app.config['SECRET_KEY'])
+    try:
+        email = verify_token(token, app.config['SECRET_KEY'])
+    except SignatureExpired:
+        flash('This verification link has expired', 'error')
+        return redirect(url_for('login'))
     if not email:
-        flash('Invalid or expired verification link', 'error')
+        flash('Invalid verification link', 'error')
         return redirect(url_for('login'))
     
-    user = db.session.query(User).filter_by(email=email).first()
+    user = get_user_by_email(email)
     if user:
         user.email_verified = True
         db.session.commit()
@@ -181,17 +283,7 @@ def google_callback():
     name = user_info.get('name')
     oauth_id = user_info.get('sub')
     
-    user = db.session.query(User).filter_by(email=email).first()
-    if not user:
-        user = User(
-            email=email,
-            username=name,
-            oauth_provider='google',
-            oauth_id=oauth_id,
-            email_verified=True
-        )
-        db.session.add(user)
-        db.session.commit()
+    user = upsert_oauth_user(email, name, 'google', oauth_id)
     
     session['user_id'] = user.id
     session['username'] = user.username or user.email
@@ -223,17 +315,7 @@ def github_callback():
     name = user_info.get('name') or user_info.get('login')
     oauth_id = str(user_info.get('id'))
     
-    user = db.session.query(User).filter_by(email=email).first()
-    if not user:
-        user = User(
-            email=email,
-            username=name,
-            oauth_provider='github',
-            oauth_id=oauth_id,
-            email_verified=True
-        )
-        db.session.add(user)
-        db.session.commit()
+    user = upsert_oauth_user(email, name, 'github', oauth_id)
     
     session['user_id'] = user.id
     session['username'] = user.username or user.email
@@ -256,48 +338,167 @@ def logout():
 @login_required
 def home():
     user_id = session.get('user_id')
-    user = db.session.get(User, user_id)
+    user = get_current_user()
     
     if not user:
         flash('User not found', 'error')
         return redirect(url_for('logout'))
     
-    result = db.session.execute(
-        db.select(Milk)
-        .filter_by(user_id=user_id)
-        .order_by(Milk.date.desc(), Milk.id.desc())
-    )
-    milk_data = list(result.scalars())
-    
-    monthly_data = defaultdict(list)
-    for record in milk_data:
-        if record.month_year:
-            monthly_data[record.month_year].append(record)
-    
-    monthly_totals = {}
-    for month, records in monthly_data.items():
-        monthly_totals[month] = sum((r.cost or 0.0) for r in records)
-    
-    sorted_months = sorted(monthly_data.keys(), key=lambda x: dt.datetime.strptime(x, "%m-%Y"), reverse=True)
-    total_cost_all = sum((m.cost or 0.0) for m in milk_data)
+    dashboard = get_home_cache(user_id)
+    if dashboard is None:
+        monthly_totals = recalc_monthly_totals(user_id)
+        sorted_months = list(monthly_totals)
+        total_cost_all = sum(monthly_totals.values())
+        
+        # Only the newest months are rendered inline; older ones load from month_records()
+        monthly_data = {}
+        if sorted_months:
+            oldest_shown = sorted_months[:HOME_RECENT_MONTHS][-1]
+            result = db.session.execute(lambda_stmt(
+                lambda: db.select(Milk.id, Milk.date, Milk.milk_qty, Milk.cost, Milk.month_year)
+                .filter_by(user_id=user_id)
+                .where(Milk.month_year >= oldest_shown)
+                .order_by(Milk.date.desc())
+            ))
+            # Rows arrive newest first, so each month's records are contiguous
+            monthly_data = {
+                month: list(records)
+                for month, records in groupby(result, key=attrgetter('month_year'))
+            }
+        
+        dashboard = {
+            'monthly_data': monthly_data,
+            'sorted_months': sorted_months,
+            'monthly_totals': monthly_totals,
+            'total': total_cost_all,
+        }
+        set_home_cache(user_id, dashboard)
 
     return render_template("index.html", 
-                         monthly_data=monthly_data, 
-                         sorted_months=sorted_months,
-                         monthly_totals=monthly_totals,
-                         total=total_cost_all,
+                         **dashboard,
                          username=session.get('username'),
                          currency_symbol=user.currency_symbol)
 
 
+@app.route('/api/month/<month>')
+@login_required
+def month_records(month):
+    """Return one month's records as JSON for the dashboard's collapsed months"""
+    user_id = session.get('user_id')
+    result = db.session.execute(lambda_stmt(
+        lambda: db.select(Milk.id, Milk.date, Milk.milk_qty, Milk.cost)
+        .filter_by(user_id=user_id, month_year=month)
+        .order_by(Milk.date.desc())
+    ))
+    # Values are preformatted to match what index.html renders for inline months
+    return jsonify([
+        {
+            'date': display_date(row.date),
+            'milk_qty': str(row.milk_qty),
+            'cost': str(round(row.cost or 0.0, 2)),
+            'edit_url': url_for('edit', id=row.id),
+            'delete_url': url_for('delete_data', id=row.id),
+        }
+        for row in result
+    ])
+
+
+@app.route('/api/milk/records')
+@login_required
+def milk_records_page():
+    """Return a page of the user's records, newest first, keyed by a date cursor"""
+    user_id = session.get('user_id')
+    try:
+        limit = min(max(int(request.args.get('limit', RECORDS_PAGE_SIZE)), 1), RECORDS_PAGE_MAX)
+        cursor = request.args.get('cursor')
+        before = dt.date.fromisoformat(cursor) if cursor else dt.date.max
+    except ValueError:
+        return jsonify(error='Invalid cursor or limit'), 400
+    
+    # Seeks the (user_id, date) index; the extra row only signals another page
+    rows = db.session.execute(
+        db.select(Milk.id, Milk.date, Milk.milk_qty, Milk.cost, Milk.month_year)
+        .filter_by(user_id=user_id)
+        .where(Milk.date < before)
+        .order_by(Milk.date.desc())
+        .limit(limit + 1)
+    ).all()
+    page = rows[:limit]
+    response = {
+        'records': [
+            {
+                'id': row.id,
+                'date': row.date.isoformat(),
+                'milk_qty': row.milk_qty,
+                'cost': row.cost,
+                'month_year': row.month_year,
+            }
+            for row in page
+        ],
+        'next_cursor': page[-1].date.isoformat() if len(rows) > limit else None,
+    }
+    if not cursor:
+        # Counted in SQL once, on the first page, rather than on every page
+        response['total_records'] = db.session.scalar(
+            db.select(db.func.count()).select_from(Milk).filter_by(user_id=user_id)
+        )
+    return jsonify(response)
+
+
+@app.route('/api/milk/records/bulk', methods=['POST'])
+@login_required
+def bulk_add_records():
+    """Insert a JSON list of {date, milk_qty} entries at once, skipping dates that already exist"""
+    user_id = session.get('user_id')
+    entries = request.get_json(silent=True)
+    if not isinstance(entries, list) or len(entries) > RECORDS_BULK_MAX:
+        return jsonify(error=f'Expected a JSON list of at most {RECORDS_BULK_MAX} records'), 400
+    
+    milk_price = db.session.scalar(lambda_stmt(
+        lambda: db.select(User.milk_price_per_litre).filter_by(id=user_id)
+    ))
+    if milk_price is None:
+        milk_price = 50.0
+    
+    rows = []
+    try:
+        for entry in entries:
+            milk_qty = float(entry['milk_qty'])
+            rows.append({
+                'user_id': user_id,
+                'date': dt.date.fromisoformat(entry['date']),
+                'milk_qty': milk_qty,
+                'cost': milk_qty * milk_price,
+            })
+    except (KeyError, TypeError, ValueError):
+        return jsonify(error='Each record needs an ISO date and a numeric milk_qty'), 400
+    
+    inserted = []
+    if rows:
+        # One executemany, which SQLAlchemy batches into multi-row INSERT ... VALUES statements
+        inserted = db.session.execute(
+            dialect_insert(Milk)
+            .on_conflict_do_nothing(index_elements=['user_id', 'date'])
+            .returning(Milk.id),
+            rows
+        ).all()
+        db.session.commit()
+        invalidate_home_cache(user_id)
+    return jsonify(inserted=len(inserted), skipped=len(rows) - len(inserted))
+
+
 @app.route("/add", methods=["GET", "POST"])
 @login_required
 def add():
     user_id = session.get('user_id')
     
     if request.method == "POST":
-        user = db.session.get(User, user_id)
-        milk_price = user.milk_price_per_litre if user else 50.0
+        # Only the price is needed, so skip loading the whole User row
+        milk_price = db.session.scalar(lambda_stmt(
+            lambda: db.select(User.milk_price_per_litre).filter_by(id=user_id)
+        ))
+        if milk_price is None:
+            milk_price = 50.0
         
         milk_qty_raw = request.form.get("number", "0")
         try:
@@ -308,39 +509,27 @@ def add():
 
         cost = milk_qty * milk_price
         
-        date_raw = request.form.get("date")
-        if date_raw:
-            try:
-                parsed = dt.datetime.strptime(date_raw, "%Y-%m-%d")
-                date_str = parsed.strftime("%d-%m-%Y")
-                month_year_str = parsed.strftime("%m-%Y")
-            except (ValueError, TypeError):
-                now = dt.datetime.now()
-                date_str = now.strftime("%d-%m-%Y")
-                month_year_str = now.strftime("%m-%Y")
-        else:
-            now = dt.datetime.now()
-            date_str = now.strftime("%d-%m-%Y")
-            month_year_str = now.strftime("%m-%Y")
-
-        existing_entry = db.session.execute(
-            db.select(Milk).filter_by(date=date_str, user_id=user_id)
-        ).scalar_one_or_none()
-        
-        if existing_entry:
-            flash(f'An entry for {date_str} already exists!', 'error')
-            return redirect(url_for('add'))
-
-        new_record = Milk(
-            milk_qty=milk_qty,
-            date=date_str,
-            cost=cost,
-            month_year=month_year_str,
-            user_id=user_id
+        try:
+            entry_date = dt.date.fromisoformat(request.form.get("date"))
+        except (ValueError, TypeError):
+            entry_date = dt.date.today()
+
+        # One round trip; the (user_id, date) unique index rejects duplicates
+        result = db.session.execute(
+            dialect_insert(Milk)
+            .values(
+                milk_qty=milk_qty,
+                date=entry_date,
+                cost=cost,
+                user_id=user_id
+            )
+            .on_conflict_do_nothing(index_elements=['user_id', 'date'])
         )
-        db.session.add(new_record)
         db.session.commit()
-        recalc_monthly_totals(user_id)
+        if result.rowcount == 0:
+            flash(f'An entry for {display_date(entry_date)} already exists!', 'error')
+            return redirect(url_for('add'))
+        invalidate_home_cache(user_id)
         
         flash('Record added successfully!', 'success')
         return redirect(url_for('home'))
@@ -355,20 +544,21 @@ def edit():
     
     if request.method == "POST":
         milk_id = int(request.form.get("id"))
-        milk_record = db.session.execute(
-            db.select(Milk).filter_by(id=milk_id, user_id=user_id)
-        ).scalar_one_or_none()
+        # Fetch the record and the owner's price together in one round trip
+        row = db.session.execute(
+            milk_with_price_stmt, {'milk_id': milk_id, 'user_id': user_id}
+        ).one_or_none()
         
-        if not milk_record:
+        if not row:
             flash('Record not found or access denied', 'error')
             return redirect(url_for("home"))
+        milk_record, milk_price = row
         
         new_date_raw = request.form.get("date")
         if new_date_raw:
             try:
-                parsed = dt.datetime.strptime(new_date_raw, "%Y-%m-%d")
-                milk_record.date = parsed.strftime("%d-%m-%Y")
-                milk_record.month_year = parsed.strftime("%m-%Y")
+                parsed = dt.date.fromisoformat(new_date_raw)
+                milk_record.date = parsed
             except (ValueError, TypeError):
                 pass
 
@@ -377,22 +567,29 @@ def edit():
         except (ValueError, TypeError):
             return redirect(url_for("home"))
 
-        user = db.session.get(User, user_id)
-        milk_price = user.milk_price_per_litre if user else 50.0
+        if milk_price is None:
+            milk_price = 50.0
         new_cost = new_qty * milk_price
 
         milk_record.milk_qty = new_qty
         milk_record.cost = new_cost
-        db.session.commit()
-        recalc_monthly_totals(user_id)
+        entry_date = milk_record.date
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Moving the record onto a day that already has an entry trips uq_milk_user_date
+            db.session.rollback()
+            flash(f'An entry for {display_date(entry_date)} already exists!', 'error')
+            return redirect(url_for("home"))
+        invalidate_home_cache(user_id)
 
         flash('Record updated successfully!', 'success')
         return redirect(url_for("home"))
     else:
         milk_id = request.args.get("id")
-        milk_record = db.session.execute(
-            db.select(Milk).filter_by(id=int(milk_id), user_id=user_id)
-        ).scalar_one_or_none()
+        milk_record = db.session.scalar(
+            milk_for_owner_stmt, {'milk_id': int(milk_id), 'user_id': user_id}
+        )
         
         if not milk_record:
             flash('Record not found or access denied', 'error')
@@ -407,9 +604,9 @@ def delete_data():
     user_id = session.get('user_id')
     
     milk_id = request.args.get('id')
-    milk_to_delete = db.session.execute(
-        db.select(Milk).filter_by(id=int(milk_id), user_id=user_id)
-    ).scalar_one_or_none()
+    milk_to_delete = db.session.scalar(
+        milk_for_owner_stmt, {'milk_id': int(milk_id), 'user_id': user_id}
+    )
     
     if not milk_to_delete:
         flash('Record not found or access denied', 'error')
@@ -417,7 +614,7 @@ def delete_data():
     
     db.session.delete(milk_to_delete)
     db.session.commit()
-    recalc_monthly_totals(user_id)
+    invalidate_home_cache(user_id)
     
     flash('Record deleted successfully!', 'success')
     return redirect(url_for('home'))
@@ -431,7 +628,7 @@ def delete_data():
 @login_required
 def settings():
     user_id = session.get('user_id')
-    user = db.session.get(User, user_id)
+    user = get_current_user()
     
     if not user:
         flash('User not found', 'error')
@@ -440,7 +637,8 @@ def settings():
     if request.method == 'POST':
         milk_price = request.form.get('milk_price')
         currency = request.form.get('currency', 'INR')
-        currency_symbol = request.form.get('currency_symbol', '₹')
+        if currency not in CURRENCY_SYMBOLS:
+            currency = 'INR'
         recalculate = request.form.get('recalculate') == 'yes'
         
         try:
@@ -453,19 +651,16 @@ def settings():
             
             user.milk_price_per_litre = new_price
             user.currency = currency
-            user.currency_symbol = currency_symbol
             db.session.commit()
             
             if recalculate and old_price != new_price:
-                milk_records = db.session.execute(
-                    db.select(Milk).filter_by(user_id=user_id)
-                ).scalars().all()
-                
-                for record in milk_records:
-                    record.cost = record.milk_qty * new_price
-                
+                result = db.session.execute(
+                    db.update(Milk).filter_by(user_id=user_id).values(cost=Milk.milk_qty * new_price),
+                    execution_options={'synchronize_session': False}
+                )
                 db.session.commit()
-                flash(f'Settings updated! Recalculated {len(milk_records)} records with new price.', 'success')
+                invalidate_home_cache(user_id)
+                flash(f'Settings updated! Recalculated {result.rowcount} records with new price.', 'success')
             else:
                 flash('Settings updated successfully!', 'success')
             
@@ -475,20 +670,7 @@ def settings():
             flash('Invalid milk price', 'error')
             return redirect(url_for('settings'))
     
-    currencies = [
-        {'code': 'INR', 'symbol': '₹', 'name': 'Indian Rupee'},
-        {'code': 'USD', 'symbol': '$', 'name': 'US Dollar'},
-        {'code': 'EUR', 'symbol': '€', 'name': 'Euro'},
-        {'code': 'GBP', 'symbol': '£', 'name': 'British Pound'},
-        {'code': 'JPY', 'symbol': '¥', 'name': 'Japanese Yen'},
-        {'code': 'AUD', 'symbol': 'A$', 'name': 'Australian Dollar'},
-        {'code': 'CAD', 'symbol': 'C$', 'name': 'Canadian Dollar'},
-        {'code': 'CHF', 'symbol': 'Fr', 'name': 'Swiss Franc'},
-        {'code': 'CNY', 'symbol': '¥', 'name': 'Chinese Yuan'},
-        {'code': 'AED', 'symbol': 'د.إ', 'name': 'UAE Dirham'},
-    ]
-    
-    return render_template('settings.html', user=user, currencies=currencies)
+    return render_template('settings.html', user=user, currencies=CURRENCIES)
 
 
 if __name__ == "__main__":
@@ -1,8 +1,10 @@
 # File: models.py
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import Integer, String, Float, Boolean, DateTime, ForeignKey
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, validates
+from sqlalchemy import Integer, String, Float, Boolean, Date, DateTime, ForeignKey, func, event
+from sqlalchemy.engine import Engine
 import datetime as dt
+import sqlite3
 
 class Base(DeclarativeBase):
     pass
@@ -10,6 +12,36 @@ class Base(DeclarativeBase):
 db = SQLAlchemy(model_class=Base)
 
 
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL journaling so local SQLite commits don't fsync on every write"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-64000")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
+
+
+# Currencies offered on the settings page; a user's symbol is derived from their currency code
+CURRENCIES = [
+    {'code': 'INR', 'symbol': '₹', 'name': 'Indian Rupee'},
+    {'code': 'USD', 'symbol': '$', 'name': 'US Dollar'},
+    {'code': 'EUR', 'symbol': '€', 'name': 'Euro'},
+    {'code': 'GBP', 'symbol': '£', 'name': 'British Pound'},
+    {'code': 'JPY', 'symbol': '¥', 'name': 'Japanese Yen'},
+    {'code': 'AUD', 'symbol': 'A$', 'name': 'Australian Dollar'},
+    {'code': 'CAD', 'symbol': 'C$', 'name': 'Canadian Dollar'},
+    {'code': 'CHF', 'symbol': 'Fr', 'name': 'Swiss Franc'},
+    {'code': 'CNY', 'symbol': '¥', 'name': 'Chinese Yuan'},
+    {'code': 'AED', 'symbol': 'د.إ', 'name': 'UAE Dirham'},
+]
+CURRENCY_SYMBOLS = {currency['code']: currency['symbol'] for currency in CURRENCIES}
+
+
 class User(db.Model):
     __tablename__ = 'user'
     
@@ -20,25 +52,45 @@ class User(db.Model):
     oauth_provider: Mapped[str] = mapped_column(String(20), nullable=True)
     oauth_id: Mapped[str] = mapped_column(String(200), nullable=True)
     email_verified: Mapped[bool] = mapped_column(Boolean, default=False)
-    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=dt.datetime.utcnow)
+    # Also sent with each INSERT: older SQLite tables have created_at NOT NULL with no default
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=func.now(), server_default=func.now())
     
     # User settings
     milk_price_per_litre: Mapped[float] = mapped_column(Float, default=50.0)
     currency: Mapped[str] = mapped_column(String(10), default='INR')
-    currency_symbol: Mapped[str] = mapped_column(String(5), default='₹')
     
     # Relationship to Milk records
     milk_records = relationship('Milk', back_populates='user', cascade='all, delete-orphan')
+    
+    @property
+    def currency_symbol(self):
+        return CURRENCY_SYMBOLS.get(self.currency, self.currency)
+
+
+def month_year_default(context):
+    """Derive month_year (YYYY-MM) from the date being inserted"""
+    value = context.get_current_parameters().get('date')
+    return value.strftime("%Y-%m") if value else None
 
 
 class Milk(db.Model):
     __tablename__ = 'milk'
+    __table_args__ = (
+        db.Index('uq_milk_user_date', 'user_id', 'date', unique=True),
+        db.Index('ix_milk_user_month', 'user_id', 'month_year'),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    date: Mapped[str] = mapped_column(String(250), nullable=True, index=True)
+    date: Mapped[dt.date] = mapped_column(Date, nullable=True)
     milk_qty: Mapped[float] = mapped_column(Float, nullable=True)
     cost: Mapped[float] = mapped_column(Float, nullable=True)
-    month_year: Mapped[str] = mapped_column(String(50), nullable=True, index=True)
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('user.id'), nullable=False, index=True)
+    month_year: Mapped[str] = mapped_column(String(7), nullable=True, default=month_year_default)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('user.id'), nullable=False)
     
-    user = relationship('User', back_populates='milk_records')
\ No newline at end of file
+    user = relationship('User', back_populates='milk_records')
+
+    @validates('date')
+    def sync_month_year(self, key, value):
+        """Keep month_year in step when date is assigned on an ORM object"""
+        self.month_year = value.strftime("%Y-%m") if value else None
+        return value
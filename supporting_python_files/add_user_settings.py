@@ -10,7 +10,7 @@ from sqlalchemy import create_engine, text
 load_dotenv()
 
 def add_settings_columns():
-    """Add milk_price_per_litre, currency, and currency_symbol to User table"""
+    """Add milk_price_per_litre and currency to User table"""
     
     DATABASE_URL = os.environ.get("DATABASE_URL")
     
@@ -27,7 +27,7 @@ def add_settings_columns():
     print("="*60)
     
     try:
-        engine = create_engine(DATABASE_URL)
+        engine = create_engine(DATABASE_URL, pool_pre_ping=True)
         
         with engine.connect() as conn:
             print("\n1. Checking existing columns...")
@@ -41,61 +41,18 @@ def add_settings_columns():
             existing_columns = [row[0] for row in result]
             print(f"   Existing columns: {existing_columns}")
             
-            # Add milk_price_per_litre
-            if 'milk_price_per_litre' not in existing_columns:
-                print("\n2. Adding milk_price_per_litre column...")
-                conn.execute(text(
-                    'ALTER TABLE "user" ADD COLUMN milk_price_per_litre FLOAT DEFAULT 50.0'
-                ))
-                conn.commit()
-                print("   ✓ Added milk_price_per_litre")
-            else:
-                print("\n2. milk_price_per_litre already exists")
-            
-            # Add currency
-            if 'currency' not in existing_columns:
-                print("\n3. Adding currency column...")
-                conn.execute(text(
-                    "ALTER TABLE \"user\" ADD COLUMN currency VARCHAR(10) DEFAULT 'INR'"
-                ))
-                conn.commit()
-                print("   ✓ Added currency")
-            else:
-                print("\n3. currency already exists")
-            
-            # Add currency_symbol
-            if 'currency_symbol' not in existing_columns:
-                print("\n4. Adding currency_symbol column...")
-                conn.execute(text(
-                    "ALTER TABLE \"user\" ADD COLUMN currency_symbol VARCHAR(5) DEFAULT '₹'"
-                ))
-                conn.commit()
-                print("   ✓ Added currency_symbol")
-            else:
-                print("\n4. currency_symbol already exists")
-            
-            # Update existing users with defaults if needed
-            print("\n5. Updating existing users with default values...")
-            conn.execute(text("""
-                UPDATE "user" 
-                SET milk_price_per_litre = 50.0 
-                WHERE milk_price_per_litre IS NULL
-            """))
-            conn.execute(text("""
-                UPDATE "user" 
-                SET currency = 'INR' 
-                WHERE currency IS NULL
-            """))
+            # Add all settings columns in one statement; the DEFAULTs fill existing rows
+            print("\n2. Adding settings columns...")
             conn.execute(text("""
-                UPDATE "user" 
-                SET currency_symbol = '₹' 
-                WHERE currency_symbol IS NULL
+                ALTER TABLE "user"
+                    ADD COLUMN IF NOT EXISTS milk_price_per_litre FLOAT DEFAULT 50.0,
+                    ADD COLUMN IF NOT EXISTS currency VARCHAR(10) DEFAULT 'INR'
             """))
             conn.commit()
-            print("   ✓ Updated users with default values")
+            print("   ✓ Settings columns present")
             
             # Verify
-            print("\n6. Verifying changes...")
+            print("\n3. Verifying changes...")
             result = conn.execute(text("""
                 SELECT COUNT(*) FROM "user"
             """))
@@ -103,7 +60,7 @@ def add_settings_columns():
             print(f"   Total users: {user_count}")
             
             result = conn.execute(text("""
-                SELECT email, milk_price_per_litre, currency, currency_symbol 
+                SELECT email, milk_price_per_litre, currency 
                 FROM "user" 
                 LIMIT 3
             """))
@@ -111,7 +68,7 @@ def add_settings_columns():
             if users:
                 print("\n   Sample users:")
                 for user in users:
-                    print(f"   - {user[0]}: {user[2]}{user[3]} {user[1]}/L")
+                    print(f"   - {user[0]}: {user[2]} {user[1]}/L")
             
             print("\n" + "="*60)
             print("✓ SETTINGS COLUMNS ADDED SUCCESSFULLY!")
@@ -119,7 +76,6 @@ def add_settings_columns():
             print("\nUsers can now configure:")
             print("  • Milk price per litre")
             print("  • Currency preference")
-            print("  • Currency symbol")
             print("\nAccess via: /settings route")
             
             return True
@@ -133,7 +89,7 @@ def add_settings_columns():
 
 if __name__ == "__main__":
     print("\nThis script adds settings columns to the User table")
-    print("(milk_price_per_litre, currency, currency_symbol)\n")
+    print("(milk_price_per_litre, currency)\n")
     
     if not os.environ.get('DATABASE_URL'):
         print("✗ DATABASE_URL not found in environment")
@@ -8,7 +8,7 @@ from dotenv import load_dotenv
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import Integer, String, Float, Boolean, DateTime, ForeignKey
+from sqlalchemy import Integer, String, Float, Boolean, Date, DateTime, ForeignKey, func
 import datetime as dt
 
 load_dotenv()
@@ -51,20 +51,25 @@ class User(db.Model):
     oauth_provider: Mapped[str] = mapped_column(String(20), nullable=True)
     oauth_id: Mapped[str] = mapped_column(String(200), nullable=True)
     email_verified: Mapped[bool] = mapped_column(Boolean, default=False)
-    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=dt.datetime.utcnow)
+    # Also sent with each INSERT: older SQLite tables have created_at NOT NULL with no default
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=func.now(), server_default=func.now())
     
     milk_records = relationship('Milk', back_populates='user', cascade='all, delete-orphan')
 
 
 class Milk(db.Model):
     __tablename__ = 'milk'
+    __table_args__ = (
+        db.Index('uq_milk_user_date', 'user_id', 'date', unique=True),
+        db.Index('ix_milk_user_month', 'user_id', 'month_year'),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    date: Mapped[str] = mapped_column(String(250), nullable=True, index=True)
+    date: Mapped[dt.date] = mapped_column(Date, nullable=True)
     milk_qty: Mapped[float] = mapped_column(Float, nullable=True)
     cost: Mapped[float] = mapped_column(Float, nullable=True)
-    month_year: Mapped[str] = mapped_column(String(50), nullable=True, index=True)
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('user.id'), nullable=False, index=True)
+    month_year: Mapped[str] = mapped_column(String(7), nullable=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('user.id'), nullable=False)
     
     user = relationship('User', back_populates='milk_records')
 
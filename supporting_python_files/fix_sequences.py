@@ -19,57 +19,29 @@ def fix_sequences():
     
     try:
         with app.app_context():
-            print("\n1. Checking current sequences...")
+            print("\n1. Resetting sequences...")
             
-            # Get current max IDs
-            result = db.session.execute(text("SELECT MAX(id) FROM \"user\""))
-            max_user_id = result.scalar() or 0
-            
-            result = db.session.execute(text("SELECT MAX(id) FROM milk"))
-            max_milk_id = result.scalar() or 0
+            # One round trip: read both max IDs and move each sequence past it.
+            # An empty table resets its sequence so the next ID is 1.
+            result = db.session.execute(text("""
+                SELECT u.max_id, m.max_id,
+                       setval(pg_get_serial_sequence('"user"', 'id'), GREATEST(u.max_id, 1), u.max_id > 0),
+                       setval(pg_get_serial_sequence('milk', 'id'), GREATEST(m.max_id, 1), m.max_id > 0)
+                FROM (SELECT COALESCE(MAX(id), 0) AS max_id FROM "user") AS u,
+                     (SELECT COALESCE(MAX(id), 0) AS max_id FROM milk) AS m
+            """))
+            max_user_id, max_milk_id, _, _ = result.one()
+            db.session.commit()
             
             print(f"   Max User ID: {max_user_id}")
             print(f"   Max Milk ID: {max_milk_id}")
             
-            # Reset User sequence
-            print("\n2. Resetting User ID sequence...")
-            if max_user_id > 0:
-                db.session.execute(text(
-                    f"SELECT setval('user_id_seq', {max_user_id}, true)"
-                ))
-                db.session.commit()
-                print(f"   ✓ User sequence set to {max_user_id}")
-            else:
-                print("   ⊘ No users found, sequence unchanged")
-            
-            # Reset Milk sequence
-            print("\n3. Resetting Milk ID sequence...")
-            if max_milk_id > 0:
-                db.session.execute(text(
-                    f"SELECT setval('milk_id_seq', {max_milk_id}, true)"
-                ))
-                db.session.commit()
-                print(f"   ✓ Milk sequence set to {max_milk_id}")
-            else:
-                print("   ⊘ No milk records found, sequence unchanged")
-            
-            # Verify sequences
-            print("\n4. Verifying sequences...")
-            result = db.session.execute(text("SELECT last_value FROM user_id_seq"))
-            user_seq = result.scalar()
-            
-            result = db.session.execute(text("SELECT last_value FROM milk_id_seq"))
-            milk_seq = result.scalar()
-            
-            print(f"   User sequence: {user_seq}")
-            print(f"   Milk sequence: {milk_seq}")
-            
             print("\n" + "="*60)
             print("✓ SEQUENCES FIXED SUCCESSFULLY!")
             print("="*60)
             print("\nNext IDs that will be assigned:")
-            print(f"  - Next User ID: {user_seq + 1}")
-            print(f"  - Next Milk ID: {milk_seq + 1}")
+            print(f"  - Next User ID: {max_user_id + 1}")
+            print(f"  - Next Milk ID: {max_milk_id + 1}")
             print("\n✓ You can now add new records without conflicts!")
             
             return True
@@ -21,8 +21,18 @@ app = Flask(__name__)
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///milk-calculation.db"
 db.init_app(app)
 
+# This is a one-shot offline rebuild, so trade per-commit fsyncs for speed while it runs
+MIGRATION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-200000",
+)
+
 def migrate():
     with app.app_context():
+        for pragma in MIGRATION_PRAGMAS:
+            db.session.execute(text(pragma))
         try:
             print("="*60)
             print("STEP 1: Checking existing database structure...")
@@ -70,10 +80,13 @@ def migrate():
             print("STEP 3: Adding user_id column to Milk table...")
             print("="*60)
             
+            # pysqlite only opens a transaction before INSERT/UPDATE/DELETE and would autocommit the DDL
+            # below, so open one explicitly to make steps 3-5 all-or-nothing
+            db.session.execute(text("BEGIN"))
+            
             if 'user_id' not in milk_columns:
                 # Add the new column (nullable first)
                 db.session.execute(text("ALTER TABLE milk ADD COLUMN user_id INTEGER"))
-                db.session.commit()
                 print("✓ Column 'user_id' added successfully!")
             
             print("\n" + "="*60)
@@ -103,7 +116,6 @@ def migrate():
                         "password": admin_password,
                         "verified": True
                     })
-                    db.session.commit()
                     
                     result = db.session.execute(text("SELECT id FROM user WHERE email = :email"), 
                                                {"email": admin_email})
@@ -131,7 +143,6 @@ def migrate():
                     text("UPDATE milk SET user_id = :user_id WHERE user_id IS NULL"),
                     {"user_id": default_user_id}
                 )
-                db.session.commit()
                 
                 print(f"\n✓ Assigned {milk_count} milk records to user ID {default_user_id}")
             
@@ -164,6 +175,7 @@ def migrate():
             db.session.execute(text("DROP TABLE milk"))
             db.session.execute(text("ALTER TABLE milk_new RENAME TO milk"))
             
+            # Steps 3-5 commit together, so a failure part way leaves the data untouched
             db.session.commit()
             print("✓ Table structure updated successfully!")
             
@@ -186,6 +198,8 @@ def migrate():
             import traceback
             traceback.print_exc()
             return False
+        finally:
+            db.session.execute(text("PRAGMA synchronous=FULL"))
     
     return True
 
@@ -25,10 +25,11 @@ def migrate():
     with app.app_context():
         try:
             # Step 1: Check if month_year column already exists
-            result = db.session.execute(text("PRAGMA table_info(milk)"))
-            columns = [row[1] for row in result]
+            has_month_year = db.session.execute(text(
+                "SELECT 1 FROM pragma_table_info('milk') WHERE name = 'month_year'"
+            )).scalar()
             
-            if 'month_year' in columns:
+            if has_month_year:
                 print("✓ Column 'month_year' already exists. Checking for NULL values...")
             else:
                 print("Adding 'month_year' column to milk table...")
@@ -39,41 +40,33 @@ def migrate():
             
             # Step 2: Populate month_year from existing date values
             print("\nPopulating month_year from existing dates...")
-            result = db.session.execute(text("SELECT id, date FROM milk WHERE month_year IS NULL OR month_year = ''"))
-            records = result.fetchall()
+            # Keys are YYYY-MM like the app's; ISO dates give them directly and legacy DD-MM-YYYY
+            # dates are rearranged, one UPDATE per format instead of a round trip per record
+            missing = "(month_year IS NULL OR month_year = '')"
+            updated_count = db.session.execute(text(
+                f"UPDATE milk SET month_year = substr(date, 1, 7) WHERE {missing} AND date LIKE '____-__-__'"
+            )).rowcount
+            updated_count += db.session.execute(text(
+                "UPDATE milk SET month_year = substr(date, 7, 4) || '-' || substr(date, 4, 2) "
+                f"WHERE {missing} AND date LIKE '__-__-____'"
+            )).rowcount
+            db.session.commit()
             
-            updated_count = 0
+            # Anything left has no date or one in an unknown format
             error_count = 0
-            
-            for record in records:
-                record_id, date_str = record
-                
+            for record_id, date_str in db.session.execute(text(f"SELECT id, date FROM milk WHERE {missing}")):
                 if date_str:
-                    # Parse DD-MM-YYYY format
-                    parts = date_str.split('-')
-                    if len(parts) == 3:
-                        # Extract MM-YYYY
-                        month_year = f"{parts[1]}-{parts[2]}"
-                        
-                        # Update the record
-                        db.session.execute(
-                            text("UPDATE milk SET month_year = :month_year WHERE id = :id"),
-                            {"month_year": month_year, "id": record_id}
-                        )
-                        updated_count += 1
-                        print(f"  Record {record_id}: {date_str} → {month_year}")
-                    else:
-                        print(f"  ⚠ Record {record_id}: Invalid date format '{date_str}'")
-                        error_count += 1
+                    print(f"  ⚠ Record {record_id}: Invalid date format '{date_str}'")
                 else:
                     print(f"  ⚠ Record {record_id}: No date found")
-                    error_count += 1
-            
-            db.session.commit()
+                error_count += 1
             
             # Step 3: Drop the total_cost column if it exists (optional cleanup)
             print("\n" + "="*50)
-            if 'total_cost' in columns:
+            has_total_cost = db.session.execute(text(
+                "SELECT 1 FROM pragma_table_info('milk') WHERE name = 'total_cost'"
+            )).scalar()
+            if has_total_cost:
                 response = input("Do you want to remove the old 'total_cost' column? (y/n): ").lower()
                 if response == 'y':
                     print("Removing 'total_cost' column...")
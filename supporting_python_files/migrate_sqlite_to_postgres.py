@@ -3,16 +3,56 @@ Migration script to transfer data from SQLite to PostgreSQL
 Run this LOCALLY before deploying to Railway
 """
 
+import argparse
+import gzip
+import io
 import sqlite3
 import psycopg2
-from psycopg2.extras import execute_values
+from psycopg2 import sql
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def migrate_sqlite_to_postgres():
-    """Migrate all data from SQLite to PostgreSQL"""
+# Rows read from SQLite and sent per COPY; bounds memory regardless of table size
+COPY_BATCH_SIZE = 10000
+
+
+def copy_value(value):
+    """Format one value for COPY's text format"""
+    if value is None:
+        return '\\N'
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+def copy_statement(table, columns):
+    """Build a COPY ... FROM STDIN statement once per table, with quoted identifiers"""
+    return sql.SQL("COPY {} ({}) FROM STDIN").format(
+        sql.Identifier(table),
+        sql.SQL(', ').join(map(sql.Identifier, columns)),
+    )
+
+
+def copy_rows(pg_cursor, copy_sql, rows):
+    """Load rows into a PostgreSQL table with COPY FROM STDIN instead of INSERT statements"""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write('\t'.join(copy_value(value) for value in row))
+        buf.write('\n')
+    buf.seek(0)
+    pg_cursor.copy_expert(copy_sql, buf)
+
+
+def migrate_sqlite_to_postgres(mode=None):
+    """Migrate all data from SQLite to PostgreSQL
+    
+    mode='truncate' clears PostgreSQL first, mode='upsert' updates milk records that
+    already exist there for the same user and date, and None asks whether to clear.
+    """
     
     # SQLite connection
     sqlite_db = 'instance/milk-calculation.db'
@@ -46,21 +86,24 @@ def migrate_sqlite_to_postgres():
         pg_conn = psycopg2.connect(postgres_url)
         pg_cursor = pg_conn.cursor()
         
+        # Users are merged by email, so an account that already exists in PostgreSQL can have a
+        # different id there; upserts map SQLite user ids onto the PostgreSQL ones through this table
+        if mode == 'upsert':
+            pg_cursor.execute("CREATE TEMP TABLE user_id_map (sqlite_id integer PRIMARY KEY, pg_id integer NOT NULL)")
+        
         # Migrate Users
         print("\n3. Migrating Users table...")
         sqlite_cursor.execute("SELECT * FROM user")
-        users = sqlite_cursor.fetchall()
+        user_columns = [col[0] for col in sqlite_cursor.description]
+        users = sqlite_cursor.fetchmany(COPY_BATCH_SIZE)
         
         if users:
-            # Get column names
-            sqlite_cursor.execute("PRAGMA table_info(user)")
-            user_columns = [col[1] for col in sqlite_cursor.fetchall()]
-            
-            print(f"   Found {len(users)} users")
-            
             # Clear existing data in PostgreSQL (optional)
-            response = input("   Clear existing PostgreSQL data first? (y/n): ").lower()
-            if response == 'y':
+            if mode is None:
+                response = input("   Clear existing PostgreSQL data first? (y/n): ").lower()
+                if response == 'y':
+                    mode = 'truncate'
+            if mode == 'truncate':
                 try:
                     pg_cursor.execute("TRUNCATE TABLE milk, \"user\" RESTART IDENTITY CASCADE")
                     pg_conn.commit()
@@ -69,50 +112,120 @@ def migrate_sqlite_to_postgres():
                     print(f"   ⚠️  Could not clear data (tables may not exist yet): {e}")
                     print("   Continuing with migration...")
             
-            # Convert SQLite data types to PostgreSQL
-            # SQLite stores booleans as 0/1, PostgreSQL needs TRUE/FALSE
-            converted_users = []
-            for user in users:
-                user_list = list(user)
-                # Find email_verified column index
-                if 'email_verified' in user_columns:
-                    verified_idx = user_columns.index('email_verified')
-                    # Convert 0/1 to boolean
-                    user_list[verified_idx] = bool(user_list[verified_idx])
-                converted_users.append(tuple(user_list))
+            # COPY can't skip duplicates, so stage the rows and merge them in one statement.
+            # COPY's boolean input accepts SQLite's 0/1 for email_verified as is.
+            pg_cursor.execute('CREATE TEMP TABLE user_stage (LIKE "user" INCLUDING DEFAULTS) ON COMMIT DROP')
+            copy_sql = copy_statement('user_stage', user_columns)
+            staged_users = 0
+            while users:
+                copy_rows(pg_cursor, copy_sql, users)
+                staged_users += len(users)
+                users = sqlite_cursor.fetchmany(COPY_BATCH_SIZE)
             
-            # Insert users
-            insert_query = f"""
-                INSERT INTO "user" ({', '.join(user_columns)})
-                VALUES %s
+            # Upserts let the sequence number new users, since their SQLite id may already belong to
+            # someone else in PostgreSQL; user_id_map below matches them up by email instead
+            insert_columns = [column for column in user_columns if mode != 'upsert' or column != 'id']
+            column_list = sql.SQL(', ').join(map(sql.Identifier, insert_columns))
+            pg_cursor.execute(sql.SQL("""
+                INSERT INTO "user" ({columns})
+                SELECT {columns} FROM user_stage
                 ON CONFLICT (email) DO NOTHING
-            """
-            execute_values(pg_cursor, insert_query, converted_users)
+            """).format(columns=column_list))
+            migrated_users = pg_cursor.rowcount
+            if mode == 'upsert':
+                pg_cursor.execute("""
+                    INSERT INTO user_id_map (sqlite_id, pg_id)
+                    SELECT user_stage.id, "user".id FROM user_stage JOIN "user" USING (email)
+                """)
             pg_conn.commit()
-            print(f"   ✓ Migrated {len(users)} users")
+            print(f"   ✓ Migrated {migrated_users} users ({staged_users - migrated_users} already existed)")
         else:
             print("   No users to migrate")
         
         # Migrate Milk records
         print("\n4. Migrating Milk table...")
         sqlite_cursor.execute("SELECT * FROM milk")
-        milk_records = sqlite_cursor.fetchall()
+        milk_columns = [col[0] for col in sqlite_cursor.description]
         
-        if milk_records:
-            # Get column names
-            sqlite_cursor.execute("PRAGMA table_info(milk)")
-            milk_columns = [col[1] for col in sqlite_cursor.fetchall()]
-            
-            print(f"   Found {len(milk_records)} milk records")
-            
-            # Insert milk records
-            insert_query = f"""
-                INSERT INTO milk ({', '.join(milk_columns)})
-                VALUES %s
-            """
-            execute_values(pg_cursor, insert_query, milk_records)
-            pg_conn.commit()
-            print(f"   ✓ Migrated {len(milk_records)} milk records")
+        # Drop secondary indexes and foreign keys for the load and rebuild them once at the end,
+        # instead of maintaining them row by row. DDL is transactional, so a failure restores them.
+        # Upserts load into a staging table instead and need uq_milk_user_date for ON CONFLICT.
+        milk_indexes = []
+        milk_foreign_keys = []
+        if mode != 'upsert':
+            pg_cursor.execute("""
+                SELECT indexname, indexdef FROM pg_indexes
+                WHERE schemaname = current_schema() AND tablename = 'milk'
+                  AND indexname NOT IN (SELECT conname FROM pg_constraint)
+            """)
+            milk_indexes = pg_cursor.fetchall()
+            # to_regclass is NULL rather than an error when milk doesn't exist yet, so nothing matches
+            pg_cursor.execute("""
+                SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+                WHERE conrelid = to_regclass('milk') AND contype = 'f'
+            """)
+            milk_foreign_keys = pg_cursor.fetchall()
+        for index_name, _ in milk_indexes:
+            pg_cursor.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier(index_name)))
+        for constraint_name, _ in milk_foreign_keys:
+            pg_cursor.execute(sql.SQL("ALTER TABLE milk DROP CONSTRAINT {}").format(sql.Identifier(constraint_name)))
+        
+        # Upserts are staged so existing records can be merged; other modes COPY straight into milk
+        if mode == 'upsert':
+            pg_cursor.execute("CREATE TEMP TABLE milk_stage (LIKE milk INCLUDING DEFAULTS) ON COMMIT DROP")
+            copy_sql = copy_statement('milk_stage', milk_columns)
+        else:
+            copy_sql = copy_statement('milk', milk_columns)
+        
+        # Stream the table through COPY in chunks rather than loading it all into memory
+        migrated_milk = 0
+        while True:
+            milk_records = sqlite_cursor.fetchmany(COPY_BATCH_SIZE)
+            if not milk_records:
+                break
+            copy_rows(pg_cursor, copy_sql, milk_records)
+            migrated_milk += len(milk_records)
+        
+        if mode == 'upsert':
+            # Records are matched on their natural key (user, date); SQLite ids are not carried over,
+            # new rows take ids from the PostgreSQL sequence. Only rows that actually changed are rewritten.
+            insert_columns = [column for column in milk_columns if column != 'id']
+            value_columns = [column for column in insert_columns if column not in ('user_id', 'date')]
+            pg_cursor.execute(sql.SQL("""
+                INSERT INTO milk ({columns})
+                SELECT {values} FROM milk_stage
+                JOIN user_id_map ON user_id_map.sqlite_id = milk_stage.user_id
+                ON CONFLICT (user_id, date) DO UPDATE SET {updates}
+                WHERE ({current}) IS DISTINCT FROM ({incoming})
+            """).format(
+                columns=sql.SQL(', ').join(map(sql.Identifier, insert_columns)),
+                values=sql.SQL(', ').join(
+                    sql.SQL("user_id_map.pg_id") if column == 'user_id'
+                    else sql.Identifier('milk_stage', column)
+                    for column in insert_columns
+                ),
+                updates=sql.SQL(', ').join(
+                    sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(column))
+                    for column in value_columns
+                ),
+                current=sql.SQL(', ').join(sql.Identifier('milk', column) for column in value_columns),
+                incoming=sql.SQL(', ').join(
+                    sql.SQL("EXCLUDED.{}").format(sql.Identifier(column)) for column in value_columns
+                ),
+            ))
+            migrated_milk = pg_cursor.rowcount
+        
+        print("   Rebuilding indexes and foreign keys...")
+        for _, index_def in milk_indexes:
+            pg_cursor.execute(index_def)
+        for constraint_name, constraint_def in milk_foreign_keys:
+            pg_cursor.execute(sql.SQL("ALTER TABLE milk ADD CONSTRAINT {} {}").format(
+                sql.Identifier(constraint_name), sql.SQL(constraint_def)
+            ))
+        pg_conn.commit()
+        
+        if migrated_milk:
+            print(f"   ✓ Migrated {migrated_milk} milk records")
         else:
             print("   No milk records to migrate")
         
@@ -152,7 +265,7 @@ def migrate_sqlite_to_postgres():
 def export_sqlite_to_sql():
     """Export SQLite data to SQL file as backup"""
     sqlite_db = 'instance/milk-calculation.db'
-    output_file = 'sqlite_backup.sql'
+    output_file = 'sqlite_backup.sql.gz'
     
     if not os.path.exists(sqlite_db):
         print(f"✗ SQLite database not found at {sqlite_db}")
@@ -162,7 +275,8 @@ def export_sqlite_to_sql():
     
     conn = sqlite3.connect(sqlite_db)
     
-    with open(output_file, 'w') as f:
+    # Compressed on the fly; level 3 keeps most of the size win at a fraction of level 9's CPU cost
+    with gzip.open(output_file, 'wt', compresslevel=3) as f:
         for line in conn.iterdump():
             f.write('%s\n' % line)
     
@@ -171,6 +285,12 @@ def export_sqlite_to_sql():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate the SQLite database to PostgreSQL")
+    parser.add_argument('--mode', choices=['truncate', 'upsert'],
+                        help="truncate: replace all PostgreSQL data; upsert: merge milk records by user and date "
+                             "(default: ask whether to clear)")
+    args = parser.parse_args()
+    
     print("\nIMPORTANT: Before running this script:")
     print("1. Make sure you have created a PostgreSQL database in Railway")
     print("2. Copy the DATABASE_URL from Railway and add it to your .env file")
@@ -184,7 +304,7 @@ if __name__ == "__main__":
         export_sqlite_to_sql()
         
         # Run migration
-        migrate_sqlite_to_postgres()
+        migrate_sqlite_to_postgres(args.mode)
     else:
         print("\nPlease complete the preparation steps first.")
         print("\nTo get DATABASE_URL from Railway:")
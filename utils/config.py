@@ -1,6 +1,7 @@
 # File: utils/config.py
 import os
 import secrets
+from datetime import timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,9 +10,12 @@ class Config:
     """Application configuration"""
     SECRET_KEY = os.environ.get("SECRET_KEY") or secrets.token_hex(32)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Only honour X-Forwarded-* headers when a proxy in front of the app sets them (e.g. on Railway);
+    # otherwise clients could spoof their address and scheme
+    TRUST_PROXY = os.environ.get("TRUST_PROXY", "").lower() in ("1", "true", "yes")
     SQLALCHEMY_ENGINE_OPTIONS = {
         "pool_pre_ping": True,
-        "pool_recycle": 300,
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "1800")),
     }
     
     # Database
@@ -21,15 +25,40 @@ class Config:
     
     if DATABASE_URL:
         SQLALCHEMY_DATABASE_URI = DATABASE_URL
+        # Keep warm PostgreSQL connections around instead of reconnecting under load,
+        # and fail fast rather than queueing forever when the pool is exhausted
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            **SQLALCHEMY_ENGINE_OPTIONS,
+            "pool_size": int(os.environ.get("DB_POOL_SIZE", "10")),
+            "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "20")),
+            "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", "10")),
+        }
+        if DATABASE_URL.startswith("postgresql"):
+            # TCP keepalives stop idle pooled connections being silently dropped by the platform's proxy
+            SQLALCHEMY_ENGINE_OPTIONS["connect_args"] = {
+                "application_name": "milk-calculator",
+                "keepalives": 1,
+                "keepalives_idle": 30,
+            }
     else:
         SQLALCHEMY_DATABASE_URI = "sqlite:///milk-calculation.db"
     
+    # Server-side sessions (enabled in app_refactored.py when REDIS_URL is set)
+    REDIS_URL = os.environ.get("REDIS_URL")
+    SESSION_TYPE = "redis"
+    SESSION_PERMANENT = False
+    PERMANENT_SESSION_LIFETIME = timedelta(days=7)
+    
     # Email
     SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
     SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
     EMAIL_ADDRESS = os.environ.get("EMAIL_ADDRESS")
     EMAIL_PASSWORD = os.environ.get("EMAIL_PASSWORD")
     
+    # Password hashing method in Werkzeug's format, e.g. "scrypt" or "pbkdf2:sha256:600000".
+    # A lower work factor makes register/login faster but hashes cheaper to brute-force.
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+    
     # OAuth
     GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID")
     GOOGLE_CLIENT_SECRET = os.environ.get("GOOGLE_CLIENT_SECRET")
@@ -1,12 +1,48 @@
 # File: helpers.py
-from functools import wraps
+from functools import wraps, lru_cache
 from flask import session, redirect, url_for, flash
-from collections import defaultdict
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.security import generate_password_hash
+from sqlalchemy import lambda_stmt, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
 import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from itsdangerous import URLSafeTimedSerializer
-from models.models import db, Milk
+from email import policy
+from string import Template
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from models.models import db, User, Milk
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes with orjson, falling back to Flask's defaults for other types"""
+
+    def dumps(self, obj, **kwargs):
+        sort_keys = kwargs.pop('sort_keys', self.sort_keys)
+        indent = kwargs.pop('indent', None)
+        separators = kwargs.pop('separators', None)
+        # orjson covers sorted keys, compact output and two-space indents; anything else goes to json
+        if kwargs or indent not in (None, 2) or separators not in (None, (',', ':')):
+            return super().dumps(obj, sort_keys=sort_keys, indent=indent, separators=separators, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
 
 
 def login_required(f):
@@ -20,50 +56,210 @@ def login_required(f):
     return decorated_function
 
 
-def get_month_year(date_str):
-    """Extract MM-YYYY from DD-MM-YYYY"""
-    if date_str:
-        parts = date_str.split('-')
-        if len(parts) == 3:
-            return f"{parts[1]}-{parts[2]}"
-    return None
+def get_current_user():
+    """Return the logged-in User; repeat calls in a request hit the session's identity map"""
+    return db.session.get(User, session.get('user_id'))
 
 
-def recalc_monthly_totals(user_id):
-    """Recalculate monthly totals"""
-    result = db.session.execute(
-        db.select(Milk)
-        .filter_by(user_id=user_id)
-        .order_by(Milk.date, Milk.id)
+def display_date(value):
+    """Format a date as DD-MM-YYYY for display"""
+    return value.strftime("%d-%m-%Y") if value else ''
+
+
+@lru_cache(maxsize=None)
+def password_hash_prefix(method):
+    """Full method string Werkzeug stores for a hash method, e.g. scrypt -> scrypt:32768:8:1"""
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+def password_needs_rehash(password_hash, method):
+    """True if a stored hash was made with a different method or work factor"""
+    return password_hash.split('$', 1)[0] != password_hash_prefix(method)
+
+
+def get_user_by_email(email):
+    """Look up a user by email (unique index seek, cached statement)"""
+    return db.session.scalar(lambda_stmt(lambda: db.select(User).filter_by(email=email)))
+
+
+def dialect_insert(model):
+    """INSERT construct for the active backend, which supports ON CONFLICT"""
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def upsert_oauth_user(email, name, provider, oauth_id):
+    """Create the OAuth user if needed and return its (id, username, email) in one statement"""
+    stmt = dialect_insert(User).values(
+        email=email,
+        username=name,
+        oauth_provider=provider,
+        oauth_id=oauth_id,
+        email_verified=True
     )
-    records = list(result.scalars())
-    
-    monthly_groups = defaultdict(list)
-    for r in records:
-        if r.month_year:
-            monthly_groups[r.month_year].append(r)
-    
+    # No-op update on conflict so RETURNING also yields existing users unchanged
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['email'], set_={'email': stmt.excluded.email}
+    ).returning(User.id, User.username, User.email)
+    user = db.session.execute(stmt).one()
     db.session.commit()
+    return user
+
+
+# Record lookups shared by edit and delete, built once; only the bound ids change per request
+milk_for_owner_stmt = db.select(Milk).where(Milk.id == bindparam('milk_id'), Milk.user_id == bindparam('user_id'))
+milk_with_price_stmt = (
+    db.select(Milk, User.milk_price_per_litre)
+    .join(User, Milk.user_id == User.id)
+    .where(Milk.id == bindparam('milk_id'), Milk.user_id == bindparam('user_id'))
+)
+
+
+def recalc_monthly_totals(user_id):
+    """Return {month_year: total cost} for a user, newest month first, aggregated in SQL"""
+    result = db.session.execute(lambda_stmt(
+        lambda: db.select(Milk.month_year, db.func.sum(Milk.cost))
+        .filter_by(user_id=user_id)
+        .where(Milk.month_year.is_not(None))
+        .group_by(Milk.month_year)
+        .order_by(Milk.month_year.desc())
+    ))
+    return {month: total or 0.0 for month, total in result}
+
+
+# Page size defaults and cap for /api/milk/records
+RECORDS_PAGE_SIZE = 50
+RECORDS_PAGE_MAX = 200
+# Most entries accepted by one /api/milk/records/bulk request
+RECORDS_BULK_MAX = 1000
+
+# Months of records rendered inline on the dashboard; older months are fetched on demand
+HOME_RECENT_MONTHS = 2
+
+# Per-user dashboard data, reused until one of the user's records changes. The cache is per process:
+# the Procfile runs gunicorn with its default single worker, and if WEB_CONCURRENCY or extra replicas
+# add processes, the TTL bounds how long they serve totals whose invalidation happened elsewhere.
+HOME_CACHE_TTL = 60
+home_cache = {}
+
+
+def get_home_cache(user_id):
+    """Return cached dashboard data for a user, or None if missing or expired"""
+    entry = home_cache.get(user_id)
+    if entry is None:
+        return None
+    if entry[0] <= time.monotonic():
+        home_cache.pop(user_id, None)
+        return None
+    return entry[1]
+
+
+def set_home_cache(user_id, dashboard):
+    """Cache dashboard data for a user for HOME_CACHE_TTL seconds, evicting other expired entries"""
+    now = time.monotonic()
+    # Sweep on write so users who never come back don't keep their entry forever;
+    # the dict only ever holds users seen within the last HOME_CACHE_TTL seconds
+    for stale_id in [uid for uid, (expires, _) in home_cache.items() if expires <= now]:
+        home_cache.pop(stale_id, None)
+    home_cache[user_id] = (now + HOME_CACHE_TTL, dashboard)
+
+
+def invalidate_home_cache(user_id):
+    """Drop the cached dashboard data for a user"""
+    home_cache.pop(user_id, None)
+
+
+@lru_cache(maxsize=None)
+def get_email_serializer(secret_key):
+    """Return the token serializer for a secret key, built once per key"""
+    return URLSafeTimedSerializer(secret_key)
 
 
 def generate_verification_token(email, secret_key):
     """Generate email verification token"""
-    serializer = URLSafeTimedSerializer(secret_key)
+    serializer = get_email_serializer(secret_key)
     return serializer.dumps(email, salt='email-verification')
 
 
 def verify_token(token, secret_key, expiration=3600):
     """Verify email verification token"""
-    serializer = URLSafeTimedSerializer(secret_key)
+    serializer = get_email_serializer(secret_key)
     try:
         email = serializer.loads(token, salt='email-verification', max_age=expiration)
         return email
-    except:
+    except SignatureExpired:
+        # Let callers tell an expired link apart from a tampered one
+        raise
+    except BadSignature:
         return None
 
 
+# SMTP round trips run here so requests don't wait on the mail server
+email_executor = ThreadPoolExecutor(max_workers=2)
+
+
+# Each email worker thread keeps one logged-in SMTP session between messages. Like the executor,
+# these are per process, so every gunicorn worker (one by default) holds its own sessions.
+smtp_local = threading.local()
+
+
+def get_smtp_connection(config):
+    """Return this thread's SMTP session, reconnecting if the server dropped it"""
+    server = getattr(smtp_local, 'server', None)
+    if server is not None:
+        try:
+            if server.noop()[0] == 250:
+                return server
+        except (smtplib.SMTPException, OSError):
+            pass
+        close_smtp_connection()
+    server = smtplib.SMTP(config['SMTP_SERVER'], config['SMTP_PORT'])
+    server.starttls()
+    server.login(config['EMAIL_ADDRESS'], config['EMAIL_PASSWORD'])
+    smtp_local.server = server
+    return server
+
+
+def close_smtp_connection():
+    """Discard this thread's SMTP session"""
+    server = getattr(smtp_local, 'server', None)
+    smtp_local.server = None
+    if server is not None:
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+
+def deliver_email(msg, config):
+    """Send a prepared message over SMTP (runs on email_executor)"""
+    try:
+        get_smtp_connection(config).sendmail(msg['From'], [msg['To']], msg.as_bytes(policy=policy.SMTP))
+    except Exception as e:
+        close_smtp_connection()
+        print(f"Failed to send email: {e}")
+
+
+# Verification email body; only the link changes between messages
+VERIFICATION_EMAIL_TEMPLATE = Template("""
+    <html>
+      <body>
+        <h2>Welcome to Milk Calculator Dashboard!</h2>
+        <p>Please click the link below to verify your email address:</p>
+        <p><a href="$url">Verify Email</a></p>
+        <p>Or copy and paste this URL into your browser:</p>
+        <p>$url</p>
+        <p>This link will expire in 1 hour.</p>
+        <br>
+        <p>If you didn't create an account, please ignore this email.</p>
+      </body>
+    </html>
+    """)
+
+
 def send_verification_email(email, token, config):
-    """Send verification email"""
+    """Queue verification email"""
     if not config['EMAIL_ADDRESS'] or not config['EMAIL_PASSWORD']:
         print("⚠️ Email credentials not configured")
         return False
@@ -76,30 +272,9 @@ def send_verification_email(email, token, config):
     msg['From'] = config['EMAIL_ADDRESS']
     msg['To'] = email
     
-    html = f"""
-    <html>
-      <body>
-        <h2>Welcome to Milk Calculator Dashboard!</h2>
-        <p>Please click the link below to verify your email address:</p>
-        <p><a href="{verification_url}">Verify Email</a></p>
-        <p>Or copy and paste this URL into your browser:</p>
-        <p>{verification_url}</p>
-        <p>This link will expire in 1 hour.</p>
-        <br>
-        <p>If you didn't create an account, please ignore this email.</p>
-      </body>
-    </html>
-    """
-    
-    part = MIMEText(html, 'html')
+    part = MIMEText(VERIFICATION_EMAIL_TEMPLATE.substitute(url=verification_url), 'html')
     msg.attach(part)
     
-    try:
-        with smtplib.SMTP(config['SMTP_SERVER'], config['SMTP_PORT']) as server:
-            server.starttls()
-            server.login(config['EMAIL_ADDRESS'], config['EMAIL_PASSWORD'])
-            server.send_message(msg)
-        return True
-    except Exception as e:
-        print(f"Failed to send email: {e}")
-        return False
\ No newline at end of file
+    # The URL is built above while the request context is still available
+    email_executor.submit(deliver_email, msg, config)
+    return True
\ No newline at end of file